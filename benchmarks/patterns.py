@@ -0,0 +1,149 @@
+"""regex cost profile of the Megacloud patterns over stored player script versions.
+
+    python benchmarks/patterns.py [--budget MS] [--kill-after S] [--repeat N] [--out FILE] [script.js ...]
+
+every Patterns member (and ScriptIndex.ASSIGNMENT) is run as a full finditer scan of each
+script, by default the ones under fixtures/scripts (extractors.py capture megacloud adds to
+it). patterns are run in a worker process that is killed once a single pattern exceeds
+--kill-after, so a catastrophically backtracking one is reported instead of hanging the run.
+the json report has the best time and match count per pattern and script, plus the patterns
+over --budget (default ANIPY_REGEX_BUDGET, else 50ms)"""
+
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+from multiprocessing.connection import Connection
+
+from anipy.providers.hianime.extractor import Patterns, ScriptIndex
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "scripts")
+# what %%placeholders%% are filled with, the resolvers look up short identifiers
+SAMPLE_VALUE = "ab"
+
+
+def save_script(script: str) -> str:
+    """store a player script version in the corpus, named by its content"""
+    os.makedirs(SCRIPTS, exist_ok=True)
+
+    path = os.path.join(SCRIPTS, f"embed-1.{hashlib.sha1(script.encode()).hexdigest()[:12]}.min.js")
+    with open(path, "w") as f:
+        f.write(script)
+
+    return path
+
+
+def compiled_patterns() -> dict[str, re.Pattern]:
+    patterns = {}
+
+    for p in Patterns:
+        if p.name.startswith("_"):
+            continue
+
+        placeholders = re.findall(r"%%(\w+)%%", p.value)
+        patterns[p.name] = p.fmt(**{k: SAMPLE_VALUE for k in placeholders}).compiled if placeholders else p.compiled
+
+    patterns["ScriptIndex.ASSIGNMENT"] = ScriptIndex.ASSIGNMENT
+    return patterns
+
+
+def _worker(conn: Connection, path: str, names: list[str], repeat: int) -> None:
+    with open(path) as f:
+        script = f.read()
+
+    patterns = compiled_patterns()
+
+    for name in names:
+        best = float("inf")
+
+        for _ in range(repeat):
+            t = time.perf_counter()
+            matches = sum(1 for _ in patterns[name].finditer(script))
+            best = min(best, time.perf_counter() - t)
+
+        conn.send((name, best, matches))
+
+    conn.close()
+
+
+def profile_script(path: str, names: list[str], repeat: int, kill_after: float) -> dict[str, dict]:
+    ctx = multiprocessing.get_context("spawn")
+    results: dict[str, dict] = {}
+    pending = list(names)
+
+    while pending:
+        recv, send = ctx.Pipe(duplex=False)
+        worker = ctx.Process(target=_worker, args=(send, path, pending, repeat), daemon=True)
+        worker.start()
+        send.close()
+
+        while pending:
+            # the first poll also covers the worker starting up
+            if not recv.poll(kill_after):
+                worker.kill()
+                results[pending.pop(0)] = {"killed": True}
+                break
+
+            try:
+                name, elapsed, matches = recv.recv()
+
+            except EOFError:
+                results[pending.pop(0)] = {"error": f"worker exited with {worker.exitcode}"}
+                break
+
+            pending.remove(name)
+            results[name] = {
+                "ms": round(elapsed * 1000, 3),
+                "matches": matches,
+                "ms_per_match": round(elapsed * 1000 / matches, 4) if matches else None,
+            }
+
+        worker.join()
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="time every Megacloud pattern against stored player scripts")
+    parser.add_argument("scripts", nargs="*", help="player scripts, default fixtures/scripts/*.js")
+    parser.add_argument("--budget", type=float, default=float(os.getenv("ANIPY_REGEX_BUDGET") or 50), help="ms")
+    parser.add_argument("--kill-after", type=float, default=10.0, help="seconds before a pattern counts as hung")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="write the json report here instead of stdout")
+    args = parser.parse_args()
+
+    paths = args.scripts or sorted(glob.glob(os.path.join(SCRIPTS, "*.js")))
+    if not paths:
+        raise SystemExit(f"no scripts given and none stored in {SCRIPTS}")
+
+    names = list(compiled_patterns())
+    report: dict = {"budget_ms": args.budget, "patterns": {name: {} for name in names}, "flagged": []}
+
+    for path in paths:
+        script = os.path.basename(path)
+
+        for name, r in profile_script(path, names, args.repeat, args.kill_after).items():
+            report["patterns"][name][script] = r
+
+            if "ms" not in r or r["ms"] > args.budget:
+                report["flagged"].append([name, script])
+                print(f"{name:<28} {script}: {r.get('ms', r.get('error', 'killed'))}", file=sys.stderr)
+
+    report["flagged"].sort()
+    output = json.dumps(report, indent=2, sort_keys=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,13 @@ import sys
 import asyncio
 import shlex
 import os
+import threading
 
 import readline
 
+if os.name == "posix":
+    import termios
+
 from types import UnionType
 from typing import Callable, Any, get_args
 from enum import IntEnum
@@ -124,6 +128,9 @@ class CLIApp:
         self._formatter = HelpFormatter()
         self.prompt = "> "
 
+        # set while waiting for input, background jobs use it to stay out of the way of commands
+        self.idle = asyncio.Event()
+
         if os.name == "posix":
             if sys.platform == "darwin":
                 readline.parse_and_bind("bind -v")
@@ -133,11 +140,23 @@ class CLIApp:
             readline.set_completer_delims(" \t\n;")
             readline.set_completer(self._complete)
 
+    def notify(self, *args) -> None:
+        """print that is safe from background tasks, while the prompt is open it goes above it"""
+        if not self.idle.is_set():
+            print(*args)
+            return
+
+        # clear the prompt line, print, then redraw the prompt with what was typed so far
+        sys.stdout.write("\r\033[K")
+        print(*args)
+        sys.stdout.write(self.prompt + readline.get_line_buffer())
+        sys.stdout.flush()
+
     def raise_err(self, err_type: ErrorTypes, *args) -> None:
         if args:
-            print(f"\033[31mERROR: {err_type.name}:", *args, "\033[0m")
+            self.notify(f"\033[31mERROR: {err_type.name}:", *args, "\033[0m")
         else:
-            print(f"\033[31mERROR: {err_type.name}\033[0m")
+            self.notify(f"\033[31mERROR: {err_type.name}\033[0m")
 
     def completer(self, text, state):
         return None
@@ -163,9 +182,55 @@ class CLIApp:
             return func
         return wrapper
 
+    async def _input(self) -> str:
+        # input() runs in a daemon thread so the loop keeps serving background
+        # tasks while the prompt is open, and a pending read never blocks exit
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(value: str | None, exc: BaseException | None) -> None:
+            if future.done():
+                return
+
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(value)
+
+        def read() -> None:
+            try:
+                line = input(self.prompt)
+
+            except BaseException as e:
+                loop.call_soon_threadsafe(resolve, None, e)
+
+            else:
+                loop.call_soon_threadsafe(resolve, line, None)
+
+        threading.Thread(target=read, daemon=True).start()
+
+        self.idle.set()
+        try:
+            return await future
+
+        finally:
+            self.idle.clear()
+
     async def run(self) -> None:
+        # the input thread may still be inside readline when the loop exits (ctrl+c, quit
+        # from a command), with echo and canonical mode off. put the terminal back as it was
+        saved = termios.tcgetattr(sys.stdin) if os.name == "posix" and sys.stdin.isatty() else None
+
+        try:
+            await self._loop()
+
+        finally:
+            if saved is not None:
+                termios.tcsetattr(sys.stdin, termios.TCSADRAIN, saved)
+
+    async def _loop(self) -> None:
         while True:
-            full = input(self.prompt)
+            full = await self._input()
 
             for usr_input in full.split(";"):
                 usr_input = usr_input.strip()
@@ -0,0 +1,125 @@
+import asyncio
+import aiohttp
+import time
+
+from collections import deque
+from contextlib import contextmanager
+from enum import StrEnum
+from typing import AsyncIterator, Iterator
+
+
+class TrafficClass(StrEnum):
+    INTERACTIVE = "interactive"
+    PREFETCH = "prefetch"
+    BULK = "bulk"
+
+
+class BandwidthGovernor:
+    """process-wide byte accounting per traffic class. lower classes are throttled to a share of
+    the link while playback is running, and each class can have a fixed cap on top"""
+
+    window = 2.0
+    burst = 0.25
+    half_life = 30.0
+    # share of the estimated link a class may use while playback is running
+    shares = {
+        TrafficClass.INTERACTIVE:   1.0,
+        TrafficClass.PREFETCH:      0.5,
+        TrafficClass.BULK:          0.2,
+    }
+
+    def __init__(self) -> None:
+        self.caps: dict[TrafficClass, int] = {}
+
+        self.__playing = 0
+        self.__samples: deque[tuple[float, int]] = deque()
+        self.__window_bytes = 0
+        self.__link = 0.0
+        self.__decayed = time.monotonic()
+        self.__tokens: dict[TrafficClass, float] = {}
+        self.__refilled: dict[TrafficClass, float] = {}
+        self.__locks = {cls: asyncio.Lock() for cls in TrafficClass}
+
+    @property
+    def link(self) -> float:
+        """estimated link throughput in bytes/s, the decayed peak of all traffic"""
+        return self.__link
+
+    def begin_playback(self) -> None:
+        self.__playing += 1
+
+    def end_playback(self) -> None:
+        self.__playing -= 1
+
+    @contextmanager
+    def playback(self) -> Iterator[None]:
+        self.begin_playback()
+        try:
+            yield
+
+        finally:
+            self.end_playback()
+
+    def set_cap(self, cls: TrafficClass, rate: int) -> None:
+        if rate:
+            self.caps[cls] = rate
+        else:
+            self.caps.pop(cls, None)
+
+    def rate(self, cls: TrafficClass) -> float:
+        """allowed bytes/s for cls right now, 0 = unlimited"""
+        rate = float(self.caps.get(cls, 0))
+
+        if self.__playing and cls != TrafficClass.INTERACTIVE and self.__link:
+            share = self.__link * self.shares[cls]
+            rate = min(rate, share) if rate else share
+
+        return rate
+
+    def _account(self, nbytes: int) -> None:
+        now = time.monotonic()
+        self.__samples.append((now, nbytes))
+        self.__window_bytes += nbytes
+
+        while self.__samples and self.__samples[0][0] < now - self.window:
+            self.__window_bytes -= self.__samples.popleft()[1]
+
+        elapsed = max(now - self.__samples[0][0], self.window / 4)
+        current = self.__window_bytes / elapsed
+
+        # the peak decays slowly so throttled periods don't drag the estimate down
+        self.__link = max(self.__link * 0.5 ** ((now - self.__decayed) / self.half_life), current)
+        self.__decayed = now
+
+    async def consume(self, cls: TrafficClass, nbytes: int) -> None:
+        self._account(nbytes)
+
+        rate = self.rate(cls)
+        if not rate:
+            return
+
+        async with self.__locks[cls]:
+            now = time.monotonic()
+            tokens = self.__tokens.get(cls, rate * self.burst)
+            tokens = min(rate * self.burst, tokens + (now - self.__refilled.get(cls, now)) * rate)
+
+            tokens -= nbytes
+            self.__tokens[cls] = tokens
+            self.__refilled[cls] = now
+
+            if tokens < 0:
+                await asyncio.sleep(-tokens / rate)
+
+
+governor = BandwidthGovernor()
+
+
+async def iter_governed(
+        resp: aiohttp.ClientResponse,
+        cls: TrafficClass,
+        chunk_size: int = 1 << 16,
+    ) -> AsyncIterator[bytes]:
+    async for chunk in resp.content.iter_chunked(chunk_size):
+        await governor.consume(cls, len(chunk))
+        yield chunk
+
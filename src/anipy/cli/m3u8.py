@@ -0,0 +1,282 @@
+import re
+
+from dataclasses import dataclass, field
+from urllib import parse
+
+from ..core.exceptions import InvalidResponse
+
+ATTRIBUTE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_attributes(s: str) -> dict[str, str]:
+    return {k: v[1:-1] if v.startswith('"') else v for k, v in ATTRIBUTE.findall(s)}
+
+
+@dataclass
+class ByteRange:
+    length: int
+    offset: int
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.length
+
+    @property
+    def header(self) -> str:
+        return f"bytes={self.offset}-{self.end - 1}"
+
+    @staticmethod
+    def parse(s: str, default_offset: int = 0) -> "ByteRange":
+        length, _, offset = s.partition("@")
+        return ByteRange(int(length), int(offset) if offset else default_offset)
+
+
+@dataclass(frozen=True)
+class Key:
+    method:     str
+    uri:        str | None
+    iv:         bytes | None
+    keyformat:  str = "identity"
+
+
+@dataclass(frozen=True)
+class InitSection:
+    uri:        str
+    byterange:  ByteRange | None = field(default=None, hash=False)
+
+
+@dataclass
+class Segment:
+    uri:        str
+    duration:   float
+    sequence:   int
+    byterange:  ByteRange | None = None
+    key:        Key | None = None
+    init:       InitSection | None = None
+
+    @property
+    def iv(self) -> bytes:
+        if self.key and self.key.iv:
+            return self.key.iv
+
+        return self.sequence.to_bytes(16, "big")
+
+
+@dataclass
+class MediaPlaylist:
+    url:            str
+    segments:       list[Segment]
+    target_duration: float = 0
+    media_sequence: int = 0
+    endlist:        bool = False
+
+    @property
+    def duration(self) -> float:
+        return sum(s.duration for s in self.segments)
+
+
+@dataclass
+class Rendition:
+    type:       str
+    group_id:   str
+    name:       str
+    uri:        str | None
+    language:   str | None
+    default:    bool
+    autoselect: bool
+
+
+@dataclass
+class Variant:
+    uri:                str
+    bandwidth:          int
+    average_bandwidth:  int | None = None
+    resolution:         tuple[int, int] | None = None
+    frame_rate:         float | None = None
+    codecs:             str | None = None
+    audio:              str | None = None
+    subtitles:          str | None = None
+
+    @property
+    def height(self) -> int:
+        return self.resolution[1] if self.resolution else 0
+
+    @property
+    def effective_bandwidth(self) -> int:
+        return self.average_bandwidth or self.bandwidth
+
+
+@dataclass
+class MasterPlaylist:
+    url:        str
+    variants:   list[Variant]
+    renditions: list[Rendition]
+
+    def renditions_for(self, variant: Variant, type: str = "AUDIO") -> list[Rendition]:
+        group = variant.audio if type == "AUDIO" else variant.subtitles
+        return [r for r in self.renditions if r.type == type and r.group_id == group]
+
+
+def _lines(text: str) -> list[str]:
+    lines = [l.strip() for l in text.removeprefix("\ufeff").splitlines()]
+    lines = [l for l in lines if l]
+
+    if not lines or lines[0] != "#EXTM3U":
+        raise InvalidResponse("not an m3u8 playlist")
+
+    return lines
+
+
+def is_master(text: str) -> bool:
+    return "#EXT-X-STREAM-INF" in text
+
+
+def parse_master(url: str, text: str) -> MasterPlaylist:
+    variants = []
+    renditions = []
+    pending: dict[str, str] | None = None
+
+    for line in _lines(text):
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            pending = parse_attributes(line.split(":", 1)[1])
+
+        elif line.startswith("#EXT-X-MEDIA:"):
+            attrs = parse_attributes(line.split(":", 1)[1])
+            renditions.append(Rendition(
+                type=attrs.get("TYPE", ""),
+                group_id=attrs.get("GROUP-ID", ""),
+                name=attrs.get("NAME", ""),
+                uri=parse.urljoin(url, attrs["URI"]) if "URI" in attrs else None,
+                language=attrs.get("LANGUAGE"),
+                default=attrs.get("DEFAULT") == "YES",
+                autoselect=attrs.get("AUTOSELECT") == "YES",
+            ))
+
+        elif not line.startswith("#") and pending is not None:
+            resolution = None
+            if m := re.fullmatch(r"(\d+)x(\d+)", pending.get("RESOLUTION", "")):
+                resolution = int(m.group(1)), int(m.group(2))
+
+            variants.append(Variant(
+                uri=parse.urljoin(url, line),
+                bandwidth=int(pending.get("BANDWIDTH", 0)),
+                average_bandwidth=int(pending["AVERAGE-BANDWIDTH"]) if "AVERAGE-BANDWIDTH" in pending else None,
+                resolution=resolution,
+                frame_rate=float(pending["FRAME-RATE"]) if "FRAME-RATE" in pending else None,
+                codecs=pending.get("CODECS"),
+                audio=pending.get("AUDIO"),
+                subtitles=pending.get("SUBTITLES"),
+            ))
+            pending = None
+
+    if not variants:
+        raise InvalidResponse("no variant streams found")
+
+    return MasterPlaylist(url, variants, renditions)
+
+
+def parse_media(url: str, text: str) -> MediaPlaylist:
+    playlist = MediaPlaylist(url, [])
+
+    sequence = 0
+    duration = 0.0
+    byterange: str | None = None
+    key: Key | None = None
+    init: InitSection | None = None
+    ends: dict[str, int] = {}
+
+    for line in _lines(text):
+        tag, _, value = line.partition(":")
+
+        match tag:
+            case "#EXT-X-MEDIA-SEQUENCE":
+                playlist.media_sequence = sequence = int(value)
+
+            case "#EXT-X-TARGETDURATION":
+                playlist.target_duration = float(value)
+
+            case "#EXT-X-ENDLIST":
+                playlist.endlist = True
+
+            case "#EXTINF":
+                duration = float(value.split(",")[0])
+
+            case "#EXT-X-BYTERANGE":
+                byterange = value
+
+            case "#EXT-X-KEY":
+                attrs = parse_attributes(value)
+                method = attrs.get("METHOD", "NONE")
+
+                if method == "NONE":
+                    key = None
+
+                else:
+                    iv = attrs.get("IV")
+                    key = Key(
+                        method=method,
+                        uri=parse.urljoin(url, attrs["URI"]) if "URI" in attrs else None,
+                        iv=bytes.fromhex(iv[2:].rjust(32, "0")) if iv else None,
+                        keyformat=attrs.get("KEYFORMAT", "identity"),
+                    )
+
+            case "#EXT-X-MAP":
+                attrs = parse_attributes(value)
+                init = InitSection(
+                    parse.urljoin(url, attrs["URI"]),
+                    ByteRange.parse(attrs["BYTERANGE"]) if "BYTERANGE" in attrs else None,
+                )
+
+            case _ if not line.startswith("#"):
+                uri = parse.urljoin(url, line)
+
+                segment = Segment(uri, duration, sequence, key=key, init=init)
+                if byterange is not None:
+                    segment.byterange = ByteRange.parse(byterange, ends.get(uri, 0))
+                    ends[uri] = segment.byterange.end
+
+                playlist.segments.append(segment)
+
+                sequence += 1
+                duration = 0.0
+                byterange = None
+
+    return playlist
+
+
+def coalesce(segments: list[Segment], max_size: int) -> list[list[Segment]]:
+    """group adjacent byte-range segments of one resource so each group is fetched with a single range request"""
+    groups: list[list[Segment]] = []
+    size = 0
+
+    for segment in segments:
+        prev = groups[-1][-1] if groups else None
+
+        if prev is not None and prev.byterange and segment.byterange \
+                and prev.uri == segment.uri \
+                and prev.byterange.end == segment.byterange.offset \
+                and prev.key == segment.key and prev.init == segment.init \
+                and size + segment.byterange.length <= max_size:
+            groups[-1].append(segment)
+            size += segment.byterange.length
+
+        else:
+            groups.append([segment])
+            size = segment.byterange.length if segment.byterange else 0
+
+    return groups
+
+
+def select_variant(variants: list[Variant], *, bandwidth: int = 0, max_height: int = 0) -> Variant:
+    """highest quality variant within max_height that fits into bandwidth (bit/s), with some headroom"""
+    candidates = [v for v in variants if not max_height or v.height <= max_height] or \
+                 [min(variants, key=lambda v: (v.height, v.bandwidth))]
+
+    if bandwidth:
+        fitting = [v for v in candidates if v.effective_bandwidth <= bandwidth * 0.8]
+        if not fitting:
+            return min(candidates, key=lambda v: v.effective_bandwidth)
+
+        candidates = fitting
+
+    return max(candidates, key=lambda v: (v.height, v.effective_bandwidth))
@@ -9,14 +9,17 @@ import webbrowser
 from typing import Callable, Literal, overload
 
 from ..core.types import LockFileKeys, DataList, SearchList, DataObject, SearchObject, EpisodeSources, AnimeInfo
-from ..core.exceptions import InvalidResponse, InvalidStatusCode
+from ..core.exceptions import InvalidResponse, InvalidStatusCode, MPVError, QuotaExceeded
 from ..core.data import Data, Tables, Config, lock_file_update, lock_file_get_content
-from ..core.util import resolve_to_mal
+from ..core.executor import executor
+from ..core.storage import StorageManager
+from ..core.util import file_checksum, resolve_to_mal
 from ..integrations.mal import MAL, MALListStatuses
 from .builder import CLIApp, ErrorTypes
 
 
-from .player import Player
+from .governor import TrafficClass, governor
+from .player import Player, QueueItem
 
 cfg         = Config()
 data        = Data()
@@ -24,6 +27,8 @@ provider    = lambda: cfg.provider.cls
 mal         = MAL()
 ctx: DataList | SearchList
 
+download_queue: asyncio.Queue[tuple[DataObject, int]] = asyncio.Queue()
+
 def paint_text_progress(text: str, max: int, progress: int) -> str:
     text_list = list(text)
     text_len = len(text)
@@ -76,8 +81,57 @@ def render_ctx(ctx: DataList | SearchList, validate: Callable[[int, DataObject],
             print(f"  {i:<{longest_index}}  {anime.title}")
 
 
+def make_player() -> Player:
+    measured = lock_file_get_content().get(LockFileKeys.MEASURED_BANDWIDTH, 0)
+    governor.set_cap(TrafficClass.BULK, cfg.download_cap * 125)
+
+    return Player(
+        provider().extractor_headers,
+        bandwidth=cfg.bandwidth * 1000 or measured,
+        max_height=cfg.max_resolution,
+        cache_size=cfg.cache_size << 20,
+    )
+
+def get_library_dir() -> str:
+    path = os.path.expanduser(cfg.library_dir) if cfg.library_dir else os.getcwd()
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    return path
+
+async def get_local_episode(anime: DataObject | SearchObject, episode: int) -> str | None:
+    if not isinstance(anime, DataObject):
+        return None
+
+    download = data.get_download(anime.id, episode)
+    if not download:
+        return None
+
+    # a file that kept its size but not its contents (an interrupted copy, disk errors) is
+    # dropped and the episode streamed again. hashed off the loop, it takes a moment
+    if await executor.run(file_checksum, download["path"]) != download["checksum"]:
+        cli.notify(f"{download['path']} is corrupted, removed it")
+        data.remove_download(anime.id, episode)
+        return None
+
+    data.touch_download(anime.id, episode)
+    return download["path"]
+
+def make_room(*, incoming: int | None = None, keep: set[tuple[int, int]] | None = None) -> None:
+    """incoming is the size of a download about to start, 0 if its source doesn't tell"""
+    storage = StorageManager(data, cfg.library_quota << 20, get_library_dir())
+
+    if incoming == 0:
+        incoming = storage.expected_size()
+
+    for row in storage.make_room(incoming or 0, keep):
+        cli.notify(f"evicted {row['path']}")
+
 async def get_episode(*, id: int, episode: int) -> EpisodeSources | None:
-    anime = ctx[id]
+    return await resolve_episode(ctx[id], episode)
+
+async def resolve_episode(anime: DataObject | SearchObject, episode: int) -> EpisodeSources | None:
     if episode not in range(1, anime.episode_count + 1):
         return cli.raise_err(ErrorTypes.INVALID_ARGS, "episode must be withing available episodes")
 
@@ -93,10 +147,84 @@ async def get_episode(*, id: int, episode: int) -> EpisodeSources | None:
     episode_sources = await provider().get_episodes(external_id, episode)
     return episode_sources
 
+async def download_episode(
+        anime: DataObject | SearchObject,
+        episode: int,
+        *,
+        quiet: bool = False,
+        gate: asyncio.Event | None = None,
+    ) -> str | None:
+    episode_sources = await resolve_episode(anime, episode)
+    if not episode_sources:
+        return None
+
+    async with make_player() as player:
+        video_title = f"{anime.title}. Episode {episode}"
+        video_file = await player.download_file(
+            episode_sources, video_title, get_library_dir(), quiet, on_size=lambda size: make_room(incoming=size), gate=gate
+        )
+
+        if player.measured_bandwidth:
+            lock_file_update(LockFileKeys.MEASURED_BANDWIDTH, player.measured_bandwidth)
+
+    if isinstance(anime, DataObject):
+        data.add_download(anime.id, episode, video_file, await executor.run(file_checksum, video_file))
+        make_room(keep={(anime.id, episode)})
+
+    return video_file
+
+def wants_auto_download(anime: DataObject) -> bool:
+    return cfg.auto_download and (anime.highlighted or data.is_subscribed(anime.id))
+
+async def download_worker() -> None:
+    while True:
+        anime, episode = await download_queue.get()
+
+        try:
+            # only work while the prompt is idle, not during playback or other commands
+            await cli.idle.wait()
+
+            if data.get_download(anime.id, episode):
+                continue
+
+            # and pause again whenever a command takes over the prompt
+            if await download_episode(anime, episode, quiet=True, gate=cli.idle):
+                cli.notify(f"downloaded {anime.title}. Episode {episode}")
+
+        except Exception as e:
+            # anything one episode raises (network, disk, a broken extractor) must not end the
+            # worker for the rest of the session. cancellation isn't an Exception and still stops it
+            cli.raise_err(ErrorTypes.REQUEST_ERROR, f"auto download of {anime.title} episode {episode} failed: {e!r}")
+
+        finally:
+            download_queue.task_done()
+
+async def mark_watched(anime: DataObject, episode: int, mal_id: str) -> None:
+    if anime.status != "watchlist":
+        return
+
+    if anime.highlighted:
+        anime.highlighted = False
+
+    if episode < anime.episode_count:
+        anime.continue_from = episode + 1
+
+        await mal.list_add(mal_id, anime.continue_from - 1, MALListStatuses.WATCHING)
+
+    else:
+        anime.finished_at = int(time.time())
+        anime.status = "completed"
+        anime.continue_from = 1
+
+        await mal.list_add(mal_id, anime.episode_count, MALListStatuses.COMPLETED)
+
+    data.update(Tables.DATA.name, anime.json(), {"id": anime.id})
+
 async def update_watchlist(force: bool) -> None:
     async def uw(anime: DataObject):
         mal_id = await check_provider_external_id(anime)
         anime_new = await provider().get_anime(mal_id)
+        episode_count = anime.episode_count
 
         for k, v in anime_new.json().items():
             if not k.startswith("_") and hasattr(anime, k):
@@ -107,6 +235,10 @@ async def update_watchlist(force: bool) -> None:
 
         data.update(Tables.DATA.name, anime.json(), {"id": anime.id})
 
+        if wants_auto_download(anime):
+            for episode in range(episode_count + 1, anime.episode_count + 1):
+                download_queue.put_nowait((anime, episode))
+
     wl_last_updated = lock_file_get_content().get(LockFileKeys.WATCHLIST_LAST_REFRESH, 0)
 
     if force or int(time.time()) - wl_last_updated >= 86400:
@@ -378,22 +510,39 @@ def dehighlight(id: int):
     data.update(Tables.DATA.name, anime.json(), {"id": anime.id})
 
 
+@cli.on(["sub"], {"id": lambda id: id in range(0, len(ctx))})
+def subscribe(id: int):
+    """download new episodes of anime automatically when watchlist refresh finds them (requires auto_download)"""
+    if not isinstance(ctx, DataList):
+        return cli.raise_err(ErrorTypes.INVALID_CONTEXT, "context must be Data type")
+
+    data.subscribe(ctx[id].id)
+
+
+@cli.on(["unsub"], {"id": lambda id: id in range(0, len(ctx))})
+def unsubscribe(id: int):
+    """stop downloading new episodes of anime automatically"""
+    if not isinstance(ctx, DataList):
+        return cli.raise_err(ErrorTypes.INVALID_CONTEXT, "context must be Data type")
+
+    data.unsubscribe(ctx[id].id)
+
+
 @cli.on(["d"], {"id": lambda id: id in range(0, len(ctx))})
 async def download(id: int, episode: int):
     """download an episode"""
     anime = ctx[id]
 
+    if local_file := await get_local_episode(anime, episode):
+        print(f"already downloaded: {local_file}")
+        return
+
     try:
-        episode_sources = await get_episode(id=id, episode=episode)
-        if not episode_sources:
+        if not await download_episode(anime, episode):
             cli.raise_err(ErrorTypes.REQUEST_ERROR, "failed to get episode")
             return
 
-        async with Player(provider().extractor_headers) as player:
-            video_title = f"{anime.title}. Episode {episode}"
-            await player.download_file(episode_sources, video_title, os.getcwd())
-
-    except (InvalidResponse, InvalidStatusCode, SystemError) as e:
+    except (InvalidResponse, InvalidStatusCode, SystemError, QuotaExceeded) as e:
         print(e)
         return cli.raise_err(ErrorTypes.INVALID_RESULT, e)
 
@@ -403,15 +552,21 @@ async def play(id: int, episode: int):
     """play specified episode. this command won't increment continue_from, dehighlight, and move to completed (if last episode was played)"""
 
     anime = ctx[id]
+    video_title = f"{anime.title}. Episode {episode}"
 
     try:
+        if local_file := await get_local_episode(anime, episode):
+            print(video_title)
+
+            async with make_player() as player:
+                return await player.play_local(local_file, video_title)
+
         episode_sources = await get_episode(id=id, episode=episode)
         if not episode_sources:
             cli.raise_err(ErrorTypes.REQUEST_ERROR, "failed to get episode")
             return
 
-        async with Player(provider().extractor_headers) as player:
-            video_title = f"{anime.title}. Episode {episode}"
+        async with make_player() as player:
             print(video_title)
 
             await player.play_file(episode_sources, video_title)
@@ -436,38 +591,87 @@ async def play_next(id: int):
         cli.raise_err(ErrorTypes.INVALID_RESULT, e, anime.title)
         return 
 
-    episode_sources = await get_episode(id=id, episode=episode)
-    if not episode_sources:
-        return
+    local_file = await get_local_episode(anime, episode)
+
+    if not local_file:
+        episode_sources = await get_episode(id=id, episode=episode)
+        if not episode_sources:
+            return
 
     try:
-        async with Player(provider().extractor_headers) as player:
+        async with make_player() as player:
             video_title = f"{anime.title}. Episode {episode}"
             print(video_title)
 
-            await player.play_file(episode_sources, video_title)
+            if local_file:
+                await player.play_local(local_file, video_title)
+
+            else:
+                await player.play_file(episode_sources, video_title)
 
     except (InvalidResponse, InvalidStatusCode) as e:
         return cli.raise_err(ErrorTypes.INVALID_RESULT, e)
 
     else:
-        if anime.status == "watchlist":
-            if anime.highlighted:
-                anime.highlighted = False
+        await mark_watched(anime, episode, mal_id)
 
-            if episode < anime.episode_count:
-                anime.continue_from = episode + 1
 
-                await mal.list_add(mal_id, anime.continue_from - 1, MALListStatuses.WATCHING)
+@cli.on(["b"], {"id": lambda id: id in range(0, len(ctx))})
+async def binge(id: int):
+    """play episodes back to back in one player starting from the next one, progress is updated as each episode ends"""
+    if not isinstance(ctx, DataList):
+        return cli.raise_err(ErrorTypes.INVALID_CONTEXT)
 
-            else:
-                anime.finished_at = int(time.time())
-                anime.status = "completed"
-                anime.continue_from = 1
+    anime = ctx[id]
 
-                await mal.list_add(mal_id, anime.episode_count, MALListStatuses.COMPLETED)
+    try:
+        mal_id = await check_mal_external_id(anime)
 
-            data.update(Tables.DATA.name, anime.json(), {"id": anime.id})
+    except ValueError as e:
+        cli.raise_err(ErrorTypes.INVALID_RESULT, e, anime.title)
+        return
+
+    # episodes resolved ahead of the one playing, source urls expire so not too many
+    ahead = asyncio.Semaphore(cfg.binge_ahead + 1)
+
+    async def feed(player: Player) -> None:
+        try:
+            for episode in range(anime.continue_from, anime.episode_count + 1):
+                await ahead.acquire()
+                video_title = f"{anime.title}. Episode {episode}"
+
+                if local_file := await get_local_episode(anime, episode):
+                    await player.enqueue(QueueItem(video_title, episode, local_file))
+                    continue
+
+                episode_sources = await resolve_episode(anime, episode)
+                if not episode_sources:
+                    break
+
+                await player.enqueue(await player.queue_item(episode_sources, video_title, episode))
+
+        except (InvalidResponse, InvalidStatusCode, MPVError) as e:
+            cli.raise_err(ErrorTypes.INVALID_RESULT, e)
+
+        finally:
+            await player.close_queue()
+
+    try:
+        async with make_player() as player:
+            await player.open_queue()
+            feeder = asyncio.create_task(feed(player))
+
+            async for item, watched in player.ended():
+                ahead.release()
+
+                if watched:
+                    print(item.title)
+                    await mark_watched(anime, item.episode, mal_id)
+
+            feeder.cancel()
+
+    except (InvalidResponse, InvalidStatusCode, MPVError) as e:
+        return cli.raise_err(ErrorTypes.INVALID_RESULT, e)
 
 
 def print_info(info: AnimeInfo, keys: list[str] | None) -> None:
@@ -586,8 +790,9 @@ def config_get(key: str):
 def config():
     """get config info"""
     annotations = cfg._get_annotations()
+    w = max(len(k) for k in annotations)
     for k, v in annotations.items():
-        print(f"  {k:<9} {v:<17}= {getattr(cfg, k)}")
+        print(f"  {k:<{w}} {v:<17}= {getattr(cfg, k)}")
 
 
 @cli.on(
@@ -621,11 +826,18 @@ async def main_():
 
     ctx = data.watchlist
     cli.prompt = cfg.prompt.format(ctx.name)
+
+    worker = asyncio.create_task(download_worker())
     await update_watchlist(False)
 
     show_banner()
 
-    await cli.run()
+    try:
+        await cli.run()
+
+    finally:
+        worker.cancel()
+        executor.close()
 
 
 def main():
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+
+from typing import Any, Callable
+
+from ..core.exceptions import MPVError
+from ..core.util import get_temp_dir
+
+
+class MPV:
+    """mpv process controlled over its JSON IPC socket"""
+
+    connect_timeout = 10.0
+
+    def __init__(self, player_bin: str = "mpv") -> None:
+        self.player_bin = player_bin
+
+        # last known values of observed properties, e.g. time-pos, pause, path
+        self.properties: dict[str, Any] = {}
+        self.eof_reason: str | None = None
+
+        self.__proc: asyncio.subprocess.Process | None = None
+        self.__reader: asyncio.StreamReader | None = None
+        self.__writer: asyncio.StreamWriter | None = None
+        self.__listen_task: asyncio.Task | None = None
+
+        self.__request_id = 0
+        self.__pending: dict[int, asyncio.Future] = {}
+        self.__observers: dict[int, str] = {}
+        self.__handlers: dict[str, list[Callable[[dict], None]]] = {}
+
+        self.__socket = os.path.join(get_temp_dir(), f"mpv-{os.getpid()}-{id(self)}.sock")
+
+    @property
+    def position(self) -> float:
+        return self.properties.get("time-pos") or 0.0
+
+    @property
+    def paused(self) -> bool:
+        return bool(self.properties.get("pause"))
+
+    @property
+    def running(self) -> bool:
+        return self.__proc is not None and self.__proc.returncode is None
+
+    async def start(self, args: list[str]) -> None:
+        if not shutil.which(self.player_bin):
+            raise SystemError(f"'{self.player_bin}' executable not found")
+
+        if os.path.exists(self.__socket):
+            os.remove(self.__socket)
+
+        self.__proc = await asyncio.create_subprocess_exec(
+            self.player_bin, f"--input-ipc-server={self.__socket}", *args,
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+
+        # named pipes on windows aren't reachable with asyncio streams, the
+        # process still runs there, only without state updates
+        if os.name == "posix":
+            await self._connect()
+
+    async def _connect(self) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.connect_timeout
+
+        while True:
+            try:
+                self.__reader, self.__writer = await asyncio.open_unix_connection(self.__socket)
+                break
+
+            except (FileNotFoundError, ConnectionRefusedError):
+                if not self.running or loop.time() > deadline:
+                    return
+
+                await asyncio.sleep(0.05)
+
+        self.__listen_task = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        assert self.__reader
+
+        while line := await self.__reader.readline():
+            try:
+                msg = json.loads(line)
+
+            except json.JSONDecodeError:
+                continue
+
+            if "request_id" in msg and "event" not in msg:
+                future = self.__pending.pop(msg["request_id"], None)
+                if future and not future.done():
+                    if msg.get("error") == "success":
+                        future.set_result(msg.get("data"))
+                    else:
+                        future.set_exception(MPVError(msg.get("error")))
+
+                continue
+
+            self._dispatch(msg)
+
+        for future in self.__pending.values():
+            if not future.done():
+                future.set_exception(MPVError("ipc connection closed"))
+
+        self.__pending.clear()
+
+    def _dispatch(self, msg: dict) -> None:
+        match msg.get("event"):
+            case "property-change":
+                self.properties[msg["name"]] = msg.get("data")
+
+            case "end-file":
+                self.eof_reason = msg.get("reason")
+
+            case "start-file":
+                self.eof_reason = None
+
+        for handler in self.__handlers.get(msg.get("event", ""), []):
+            handler(msg)
+
+    def on(self, event: str, handler: Callable[[dict], None]) -> None:
+        self.__handlers.setdefault(event, []).append(handler)
+
+    async def command(self, *args: Any) -> Any:
+        if not self.__writer or self.__writer.is_closing():
+            raise MPVError("ipc not connected")
+
+        self.__request_id += 1
+        request_id = self.__request_id
+
+        future = asyncio.get_running_loop().create_future()
+        self.__pending[request_id] = future
+
+        self.__writer.write(json.dumps({"command": list(args), "request_id": request_id}).encode() + b"\n")
+        await self.__writer.drain()
+
+        return await future
+
+    async def observe(self, *names: str) -> None:
+        for name in names:
+            observer_id = len(self.__observers) + 1
+            self.__observers[observer_id] = name
+            await self.command("observe_property", observer_id, name)
+
+    async def get(self, name: str) -> Any:
+        return await self.command("get_property", name)
+
+    async def set(self, name: str, value: Any) -> None:
+        await self.command("set_property", name, value)
+
+    async def wait(self) -> int:
+        assert self.__proc
+
+        _, stderr = await self.__proc.communicate()
+        await self.close()
+
+        if self.__proc.returncode != 0:
+            raise SystemError(self.__proc.returncode, stderr.decode())
+
+        return self.__proc.returncode
+
+    async def quit(self) -> None:
+        if self.running:
+            try:
+                await self.command("quit")
+
+            except MPVError:
+                if self.running:
+                    assert self.__proc
+                    self.__proc.terminate()
+
+    async def close(self) -> None:
+        if self.__writer:
+            self.__writer.close()
+
+        if self.__listen_task:
+            await asyncio.gather(self.__listen_task, return_exceptions=True)
+
+        if os.path.exists(self.__socket):
+            os.remove(self.__socket)
@@ -1,23 +1,33 @@
 import asyncio
 import aiohttp
-import math
 import os
 import re
 import shutil
 import hashlib
-import requests
 import time
 import subprocess
 import tempfile
-import base64
 
-from typing import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable
+from urllib import parse
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import unpad
 
 from ..core.types import EpisodeSources
-from ..core.exceptions import InvalidResponse, InvalidStatusCode
+from ..core.exceptions import InvalidResponse, InvalidStatusCode, MPVError
 from ..core.util import get_temp_dir
 
+from .m3u8 import ByteRange, InitSection, Key, MasterPlaylist, MediaPlaylist, Rendition, Segment, Variant, \
+    coalesce, is_master, parse_master, parse_media, select_variant
+from .mpv import MPV
 from .progressbar import ProgressBar
+from .subtitles import Subtitle, SubtitleCache
+from .proxy import HLSProxy, SegmentCache
+from .governor import TrafficClass, governor, iter_governed
+from .writer import BufferedWriter
+from .transfer import AIMDController, RangedDownloader, content_range_size, read_head, sniff_source
 import random
 
 
@@ -32,9 +42,12 @@ async def make_request[T](
         url: str, 
         headers: dict, 
         handler: Callable[[aiohttp.ClientResponse], Awaitable[T]],
+        *,
+        partial: bool = False,
     ) -> T:
     async with session.request(method.upper(), url, headers=headers) as resp:
-        if resp.status not in [200, 520]:
+        # a server that ignores Range answers 200 with the whole file, which must not pass for the range
+        if resp.status not in ([206] if partial else [200, 206, 520]):
             raise InvalidStatusCode(resp.status, resp.url)
 
         try:
@@ -46,179 +59,511 @@ async def make_request[T](
         return data
 
 class HLSClient:
-    def __init__(self, session: aiohttp.ClientSession, headers: dict) -> None:
+    def __init__(self, session: aiohttp.ClientSession, headers: dict, *, bandwidth: int = 0, max_height: int = 0) -> None:
         self.headers = headers
         self.session = session
+        self.bandwidth = bandwidth
+        self.max_height = max_height
+        # picked by the last extract_playlists, None for a bare media playlist
+        self.variant: Variant | None = None
 
-    async def get_master_file(self, master_url: str) -> tuple[str, re.Match]:
-        index_pattern = r"#EXT-X-STREAM-INF:PROGRAM-ID=\d+,BANDWIDTH=\d+,RESOLUTION=(\d+)x(\d+),FRAME-RATE=[\d\.]+,CODECS=\"[\w\.,]+\"\n(.+?)\n"
-        master_response = await make_request(self.session, "get", master_url, self.headers, lambda i: i.text())
+    async def _get_text(self, url: str) -> str:
+        return await make_request(self.session, "get", url, self.headers, lambda r: r.text())
 
-        vids = re.finditer(index_pattern, master_response)
-        if not vids:
-            raise InvalidResponse("no index files found")
+    async def get_master_file(self, master_url: str, master: str | None = None) -> MasterPlaylist | MediaPlaylist:
+        if master is None:
+            master = await self._get_text(master_url)
 
-        sort_by_res = lambda vid: int(vid.group(1)) * int(vid.group(2))
-        vid = sorted(vids, key=sort_by_res)[-1]
-        return master_response, vid
+        if is_master(master):
+            return parse_master(master_url, master)
 
-    async def extract_segments(self, master_url: str) -> list[str]:
-        segments_pattern = r"EXTINF:[\d\.]+,\n([^\n]+)"
-        segment_urls = []
+        return parse_media(master_url, master)
 
-        base_url = master_url.rsplit("/", 1)[0]
+    def select(self, master: MasterPlaylist) -> tuple[Variant, Rendition | None]:
+        variant = select_variant(master.variants, bandwidth=self.bandwidth, max_height=self.max_height)
 
-        _, vid = await self.get_master_file(master_url)
-        filename = vid.group(3)
+        audio = [r for r in master.renditions_for(variant) if r.uri]
+        rendition = next((r for r in audio if r.default), audio[0] if audio else None)
 
-        if filename.startswith("https://"):
-            index_url = filename
-        else:
-            index_url = f"{base_url}/{filename}"
+        return variant, rendition
+
+    async def extract_playlists(self, master_url: str, master: str | None = None) -> tuple[MediaPlaylist, MediaPlaylist | None]:
+        playlist = await self.get_master_file(master_url, master)
+        if isinstance(playlist, MediaPlaylist):
+            return playlist, None
+
+        variant, rendition = self.select(playlist)
+        self.variant = variant
+
+        if rendition and rendition.uri:
+            video_text, audio_text = await asyncio.gather(self._get_text(variant.uri), self._get_text(rendition.uri))
+            return parse_media(variant.uri, video_text), parse_media(rendition.uri, audio_text)
+
+        return parse_media(variant.uri, await self._get_text(variant.uri)), None
+
+def _concat(out_dir: str, parts: list[bytes | str]) -> str:
+    fd, playlist_file = tempfile.mkstemp(dir=out_dir)
 
-        index_file_content = await make_request(self.session, "get", index_url, self.headers, lambda e: e.text())
+    with os.fdopen(fd, "wb") as f:
+        for part in parts:
+            if isinstance(part, bytes):
+                f.write(part)
+                continue
 
-        for m in re.finditer(segments_pattern, index_file_content):
-            segment = m.group(1)
+            with open(part, "rb") as fseg:
+                shutil.copyfileobj(fseg, f, 1 << 20)
 
-            if segment.startswith("https://"):
-                segment_urls.append(segment)
-            else:
-                segment_urls.append(f"{base_url}/{segment}")
+            os.remove(part)
+
+    return playlist_file
+
+
+def estimate_size(playlists: list[MediaPlaylist], variant: Variant | None) -> int:
+    """bytes an hls download will take: exact when every segment is a byterange, else the
+    variant's bandwidth over the video's duration. 0 if neither is known"""
+    segments = [s for p in playlists for s in p.segments]
+    if segments and all(s.byterange for s in segments):
+        return sum(s.byterange.length for s in segments if s.byterange)
+
+    if variant:
+        return int((variant.average_bandwidth or variant.bandwidth) * playlists[0].duration / 8)
+
+    return 0
 
-        return segment_urls
 
 class VideoDownloader:
-    def __init__(self, session: aiohttp.ClientSession, headers: dict) -> None:
+    retries = 5
+    retry_delay = 0.5
+    sniff_size = 1 << 16
+    max_range = 1 << 25
+
+    def __init__(
+            self,
+            session: aiohttp.ClientSession,
+            headers: dict,
+            *,
+            bandwidth: int = 0,
+            max_height: int = 0,
+            cache: SegmentCache | None = None,
+            quiet: bool = False,
+            traffic: TrafficClass = TrafficClass.BULK,
+            on_size: Callable[[int], None] | None = None,
+            gate: asyncio.Event | None = None,
+        ) -> None:
         self.headers = headers
         self.session = session
+        self.bandwidth = bandwidth
+        self.max_height = max_height
+        self.cache = cache
+        self.quiet = quiet
+        self.traffic = traffic
+        # called once before anything is written, with the file's size or an estimate, 0 if unknown
+        self.on_size = on_size
+        # new segment and range requests only start while it is set, None never pauses. the gate
+        # isn't checked mid-body, a paused read would run into the session's read timeout
+        self.gate = gate
+        self.controller = AIMDController()
+        self.writer = BufferedWriter()
+
+        self.transferred = 0
+        self.measured_bandwidth = 0
+        self.__keys: dict[str, asyncio.Future[bytes]] = {}
 
     def cleanup(self) -> None:
         dir = get_temp_dir()
         for i in os.listdir(dir):
-            if re.match(r"seg\d+|index_|master_", i):
+            if re.match(r"seg\d+|index_|master_|\w+_seg\d+\.part", i):
                 os.remove(os.path.join(dir, i))
 
-    async def _write_segment(self, id: str, url: str, out_dir: str, pb: ProgressBar) -> None:
-        pattern = r"seg-(\d+)"
-        url_filename = url.rsplit('/', maxsplit=1)[1]
+    async def _get_key(self, key: Key) -> bytes:
+        if key.method != "AES-128" or not key.uri:
+            raise InvalidResponse(f"unsupported segment encryption {key.method}")
+
+        if key.uri not in self.__keys:
+            self.__keys[key.uri] = asyncio.ensure_future(
+                make_request(self.session, "get", key.uri, self.headers, lambda r: r.read())
+            )
+
+        return await self.__keys[key.uri]
+
+    async def _fetch_range(self, url: str, byterange: ByteRange | None) -> bytes:
+        headers = self.headers | {"Range": byterange.header} if byterange else self.headers
+        return await make_request(self.session, "get", url, headers, lambda r: r.read(), partial=byterange is not None)
+
+    def _from_cache(self, segments: list[Segment], path: str) -> bool:
+        if not self.cache:
+            return False
+
+        # segments streamed earlier are cached one by one, a group is only
+        # usable if every part of it is there
+        parts = []
+        for segment in segments:
+            data = self.cache.get(segment.uri, segment.byterange)
+            if data is None:
+                return False
+
+            parts.append(data)
+
+        with open(f"{path}.part", "wb") as f:
+            for data in parts:
+                f.write(data)
+
+        return True
+
+    def _finish_group(self, segments: list[Segment], path: str, key: bytes | None) -> int:
+        if key:
+            with open(f"{path}.part", "rb") as f:
+                data = f.read()
+
+            # a coalesced range holds several segments back to back, each one
+            # is its own CBC stream with its own IV
+            with open(f"{path}.part", "wb") as f:
+                pos = 0
+                for segment in segments:
+                    length = segment.byterange.length if segment.byterange else len(data)
+                    plain = AES.new(key, AES.MODE_CBC, segment.iv).decrypt(data[pos:pos + length])
+                    f.write(unpad(plain, AES.block_size))
+                    pos += length
+
+        os.replace(f"{path}.part", path)
+        return os.path.getsize(path)
+
+    async def _write_segment(self, segments: list[Segment], path: str, pb: ProgressBar) -> None:
+        if not await self.writer.run(self._from_cache, segments, path):
+            await self._fetch_group(segments, path)
+
+        first = segments[0]
+        key = await self._get_key(first.key) if first.key else None
+
+        size = await self.writer.run(self._finish_group, segments, path, key)
+        pb.update(len(segments), size)
 
-        if url_filename.startswith("c2VnL"):
-            url_filename = base64.b64decode(url_filename).decode()
+    async def _fetch_group(self, segments: list[Segment], path: str) -> None:
+        first, last = segments[0], segments[-1]
+        headers = self.headers
+        ranged = bool(first.byterange and last.byterange)
 
-        m = re.search(pattern, url_filename)
-        if not m:
-            print(url_filename)
-            assert m
+        if ranged:
+            headers = self.headers | {"Range": f"bytes={first.byterange.offset}-{last.byterange.end - 1}"}
 
-        filename = f"{id}_seg{m.group(1)}"
-        path = os.path.join(out_dir, filename)
+        for attempt in range(self.retries):
+            written = 0
 
-        async def _write(resp: aiohttp.ClientResponse):
-            with open(path, "wb") as f:
-                async for chunk in resp.content.iter_any():
-                    f.write(chunk)
+            async def _write(resp: aiohttp.ClientResponse):
+                nonlocal written
+                out = await self.writer.open(f"{path}.part")
 
-        await make_request(self.session, "get", url, self.headers, _write)
+                async with out, out.stream() as stream:
+                    async for chunk in iter_governed(resp, self.traffic):
+                        await stream.write(chunk)
+                        written += len(chunk)
 
-        pb.update()
+            if self.gate:
+                await self.gate.wait()
+
+            await self.controller.acquire()
+            start = time.monotonic()
+            failed = True
+
+            try:
+                # the body is split across every segment of the group, a whole-file 200 would corrupt them all
+                await make_request(self.session, "get", first.uri, headers, _write, partial=ranged)
+                failed = False
+
+            except (aiohttp.ClientError, asyncio.TimeoutError, InvalidStatusCode, InvalidResponse):
+                if attempt == self.retries - 1:
+                    raise
+
+            finally:
+                # whatever ends the attempt (writer errors, cancellation too) gives the slot back
+                await self.controller.release(written, time.monotonic() - start, failed)
+
+            if not failed:
+                self.transferred += written
+                break
+
+            await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    async def _fetch_playlist(self, id: str, playlist: MediaPlaylist, out_dir: str, pb: ProgressBar) -> str:
+        groups = coalesce(playlist.segments, self.max_range)
+        paths = [os.path.join(out_dir, f"{id}_seg{i}") for i in range(len(groups))]
+
+        tasks = [self._write_segment(group, path, pb) for group, path in zip(groups, paths)]
+        await asyncio.gather(*tasks)
+
+        init: InitSection | None = None
+        parts: list[bytes | str] = []
+
+        for group, path in zip(groups, paths):
+            if group[0].init and group[0].init != init:
+                init = group[0].init
+                cached = await self.writer.run(self.cache.get, init.uri, init.byterange) if self.cache else None
+                parts.append(cached if cached is not None else await self._fetch_range(init.uri, init.byterange))
+
+            parts.append(path)
+
+        return await self.writer.run(_concat, out_dir, parts)
+
+    def _byte_progress(self, size: int, title: str) -> tuple[ProgressBar, Callable[[int], None]]:
+        progress = ProgressBar(size, title, self.quiet)
+
+        def on_progress(n: int) -> None:
+            self.transferred += n
+            progress.update(n, n)
+
+        return progress, on_progress
+
+    async def _write_stream(self, resp: aiohttp.ClientResponse, head: bytes, output_file: str) -> None:
+        if not resp.content_length:
+            raise InvalidResponse("content_length is None or 0")
+
+        self._announce(resp.content_length)
+        progress, on_progress = self._byte_progress(resp.content_length, os.path.basename(output_file))
+        out = await self.writer.open(output_file, resp.content_length)
+
+        try:
+            async with out, out.stream() as stream:
+                await stream.write(head)
+                on_progress(len(head))
+
+                async for chunk in iter_governed(resp, self.traffic):
+                    await stream.write(chunk)
+                    on_progress(len(chunk))
+
+        finally:
+            progress.close()
+
+    def _announce(self, size: int) -> None:
+        if self.on_size:
+            self.on_size(size)
+
+    def _measure(self) -> None:
+        elapsed = time.monotonic() - self.__started
+        if self.transferred >= 1 << 20 and elapsed > 0:
+            self.measured_bandwidth = int(self.transferred * 8 / elapsed)
 
     async def download(self, url: str, output_file: str) -> None:
-        content_type = requests.get(url).headers['content-type']
-        if content_type == "application/octet-stream":
-            async def write_file(resp: aiohttp.ClientResponse):
-                if not resp.content_length:
-                    raise InvalidResponse("content_length is None or 0")
+        try:
+            await self._download(url, output_file)
+
+        finally:
+            self.writer.close()
 
-                chunk_size = 8192
-                progress = ProgressBar(math.ceil(resp.content_length / chunk_size), os.path.basename(output_file))
+    async def _download(self, url: str, output_file: str) -> None:
+        self.__started = time.monotonic()
+        self.transferred = 0
 
-                with open(output_file, "wb") as f:
-                    while True:
-                        chunk = await resp.content.read(chunk_size)
-                        if not chunk:
-                            break
+        # one request both identifies the source and starts the transfer: its
+        # first bytes are either the playlist or the head of the video file
+        is_playlist = parse.urlparse(url).path.lower().endswith((".m3u8", ".m3u"))
+        headers = self.headers if is_playlist else self.headers | {"Range": f"bytes=0-{self.sniff_size - 1}"}
 
-                        f.write(chunk)
-                        progress.update()
+        async with self.session.get(url, headers=headers) as resp:
+            # the same statuses make_request takes for a whole file
+            if resp.status not in (200, 206, 520):
+                raise InvalidStatusCode(resp.status, resp.url)
 
-            await make_request(self.session, "get", url, self.headers, write_file)
+            head = await read_head(resp, self.sniff_size)
+            kind = sniff_source(url, resp.content_type, head)
+            size = content_range_size(resp)
+
+            if kind == "hls":
+                if size and size > len(head):
+                    rest_headers = self.headers | {"Range": f"bytes={len(head)}-"}
+                    head += await make_request(self.session, "get", url, rest_headers, lambda r: r.read(), partial=True)
+
+                else:
+                    head += await resp.content.read()
+
+            elif not size:
+                await self._write_stream(resp, head, output_file)
+                return self._measure()
+
+        if kind == "hls":
+            await self._download_hls(url, head.decode(), output_file)
 
         else:
-            hls = HLSClient(self.session, self.headers)
-            segments = await hls.extract_segments(url)
+            assert size
+            self._announce(size)
+            ranged = RangedDownloader(self.session, self.headers, self.writer, self.traffic, self.gate)
+            progress, on_progress = self._byte_progress(size, os.path.basename(output_file))
 
-            progress = ProgressBar(len(segments), os.path.basename(output_file))
+            try:
+                await ranged.download(url, output_file, size, on_progress, head)
 
-            t = int(time.time() * 1000000)
-            val = (t & 0xffffff) + (t >> 32)
-            id = hex(val)
+            finally:
+                progress.close()
 
-            out_dir = get_temp_dir()
+            self._measure()
 
-            tasks = [self._write_segment(id, seg, out_dir, progress) for seg in segments]
-            await asyncio.gather(*tasks)
+    async def _download_hls(self, url: str, master: str, output_file: str) -> None:
+        hls = HLSClient(self.session, self.headers, bandwidth=self.bandwidth, max_height=self.max_height)
+        video, audio = await hls.extract_playlists(url, master)
 
-            _, playlist_file = tempfile.mkstemp(dir=out_dir)
+        playlists = [video, audio] if audio else [video]
+        self._announce(estimate_size(playlists, hls.variant))
+        progress = ProgressBar(sum(len(p.segments) for p in playlists), os.path.basename(output_file), self.quiet)
 
-            segments = []
-            for file in os.listdir(out_dir):
-                seg = re.match(rf"({id}_seg\d+)", file)
-                if seg:
-                    abs_path = os.path.join(out_dir, seg.group(1))
-                    segments.append(abs_path)
+        t = int(time.time() * 1000000)
+        val = (t & 0xffffff) + (t >> 32)
+        id = hex(val)
+
+        out_dir = get_temp_dir()
+
+        try:
+            files = [await self._fetch_playlist(f"{id}{i}", p, out_dir, progress) for i, p in enumerate(playlists)]
 
-            segments = sorted(segments, key=lambda i: int(i.split("seg")[1]))
+        finally:
+            # a failed or empty transfer still takes its bar off the live block
+            progress.close()
 
-            with open(playlist_file, "wb") as f:
-                for seg in segments:
-                    with open(seg, "rb") as fseg:
-                        f.write(fseg.read())
+        self._measure()
 
-                    os.remove(seg)
+        cmd = ["ffmpeg"]
+        for file in files:
+            cmd += ["-i", file]
 
-            cmd = ["ffmpeg", "-i", playlist_file, "-c:v", "copy", "-c:a", "copy", output_file]
-            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+        if audio:
+            cmd += ["-map", "0:v", "-map", "1:a"]
 
-            os.remove(playlist_file)
-            self.cleanup()
+        cmd += ["-c:v", "copy", "-c:a", "copy", output_file]
+        proc = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        await proc.wait()
+
+        for file in files:
+            os.remove(file)
+
+        self.cleanup()
+
+
+@dataclass
+class QueueItem:
+    title:      str
+    episode:    int
+    file:       str
+    sub_files:  list[str] = field(default_factory=list)
 
 
 class Player:
-    def __init__(self, headers: dict) -> None:
+    # share of an episode that has to be played before quitting counts as watched
+    watched_ratio = 0.9
+
+    def __init__(self, headers: dict, *, bandwidth: int = 0, max_height: int = 0, cache_size: int = 1 << 30) -> None:
         self.player_bin = "mpv"
         self.headers = headers
+        self.bandwidth = bandwidth
+        self.max_height = max_height
+        self.measured_bandwidth = 0
+        self.mpv: MPV | None = None
+        self.cache = SegmentCache(os.path.join(get_temp_dir(), "segments"), cache_size)
+
+        self.__proxy: HLSProxy | None = None
+        self.__queue: list[QueueItem] = []
+        self.__current = -1
+        self.__closed = False
+        self.__ended: asyncio.Queue[tuple[QueueItem, bool] | None] = asyncio.Queue()
 
     async def __aenter__(self):
-        self.__connector = aiohttp.TCPConnector(limit=10)
-        self.__session = aiohttp.ClientSession(connector=self.__connector)
+        self.__connector = aiohttp.TCPConnector(limit=AIMDController.maximum)
+        # no total limit, an episode download takes as long as it takes. stalls are caught per read
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+        self.__session = aiohttp.ClientSession(connector=self.__connector, timeout=timeout)
+        self.subtitles = SubtitleCache(os.path.join(get_temp_dir(), "subtitles"), self.__session, self.headers)
 
         return self
 
     async def __aexit__(self, *_):
+        if self.mpv:
+            await self.mpv.quit()
+
+        if self.__proxy:
+            await self.__proxy.close()
+
         await self.__connector.close()
         await self.__session.close()
 
-    def _play(self, video_title: str, video_file: str, sub_file: str | None) -> None:
-        if not shutil.which(self.player_bin):
-            raise SystemError(f"'{self.player_bin}' executable not found")
+    def _args(self) -> list[str]:
+        headers = dict(self.headers)
+        user_agent = headers.pop("user-agent", "Mozilla/5.0 (X11; Linux x86_64; rv:139.0) Gecko/20100101 Firefox/139.0")
+        header_fields = ",".join(f"{k}: {v}" for k, v in headers.items())
+
+        return [f"--user-agent={user_agent}", f"--http-header-fields={header_fields}"]
+
+    async def _start(self, args: list[str]) -> None:
+        # mpv runs without blocking the loop: the proxy and background jobs
+        # keep going, playback state comes back over ipc
+        self.mpv = MPV(self.player_bin)
+        await self.mpv.start(args + self._args())
+
+        try:
+            await self.mpv.observe("time-pos", "duration", "pause")
+
+        except MPVError:
+            pass
+
+    async def _play(self, video_title: str, video_file: str, sub_files: list[str]) -> None:
+        args = [f"--force-media-title={video_title}"]
+        args += [f"--sub-file={sub_file}" for sub_file in sub_files]
+
+        await self._start(args + [video_file])
+
+        assert self.mpv
+        with governor.playback():
+            await self.mpv.wait()
+
+    async def _playable(self, ep_sources: EpisodeSources) -> tuple[str, list[str]]:
+        # subtitles are local files by the time mpv starts, so loading them never stalls playback
+        video_file, subtitles = await asyncio.gather(
+            self._video_url(ep_sources.source), self.subtitles.fetch(ep_sources.tracks)
+        )
+
+        return video_file, [s.path for s in subtitles]
+
+    async def _video_url(self, master_file: str) -> str:
+        if not parse.urlparse(master_file).path.lower().endswith((".m3u8", ".m3u")):
+            return master_file
 
-        args = [self.player_bin, f"--force-media-title={video_title}"]
+        # mpv plays the same variant a download would pick, so segments it
+        # caches can be reused by a later download of the episode
+        if not self.__proxy:
+            hls = HLSClient(self.__session, self.headers, bandwidth=self.bandwidth, max_height=self.max_height)
+            self.__proxy = HLSProxy(self.__session, self.headers, self.cache, select=hls.select)
+            await self.__proxy.start()
 
-        if sub_file:
-            args.append(f"--sub-file={sub_file}")
+        return self.__proxy.playlist_url(master_file)
 
-        user_agent = self.headers.pop("user-agent", "Mozilla/5.0 (X11; Linux x86_64; rv:139.0) Gecko/20100101 Firefox/139.0")
-        args.append(f"--user-agent={user_agent}")
-        header_fields = ",".join(f"{k}: {v}" for k, v in self.headers.items())
-        args.append(f"--http-header-fields={header_fields}")
+    async def _mux_subtitles(self, video_file: str, subtitles: list[Subtitle]) -> None:
+        root, ext = os.path.splitext(video_file)
+        muxed = f"{root}.subs{ext}"
 
-        args.append(video_file)
-        proc = subprocess.run(args, capture_output=True)
-        if proc.returncode != 0:
-            raise SystemError(args, proc.stderr.decode())
+        cmd = ["ffmpeg", "-y", "-i", video_file]
+        for subtitle in subtitles:
+            cmd += ["-i", subtitle.path]
 
-    async def download_file(self, ep_sources: EpisodeSources, video_title: str, output_dir: str) -> None:
+        cmd += ["-map", "0"]
+        for i, subtitle in enumerate(subtitles):
+            cmd += ["-map", str(i + 1), f"-metadata:s:s:{i}", f"title={subtitle.label}"]
+
+        cmd += ["-c", "copy", "-c:s", "mov_text", "-disposition:s:0", "default", muxed]
+
+        proc = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if await proc.wait() != 0:
+            if os.path.exists(muxed):
+                os.remove(muxed)
+
+            return
+
+        os.replace(muxed, video_file)
+
+    async def download_file(
+            self,
+            ep_sources: EpisodeSources,
+            video_title: str,
+            output_dir: str,
+            quiet: bool = False,
+            on_size: Callable[[int], None] | None = None,
+            gate: asyncio.Event | None = None,
+        ) -> str:
         filename_base = hashlib.md5(video_title.encode()).hexdigest()
         master_url = ep_sources.source
 
@@ -226,12 +571,107 @@ class Player:
             raise SystemError(f"ffmpeg not found")
 
         video_file = os.path.join(output_dir, f"{filename_base}.mp4")
-        downloader = VideoDownloader(self.__session, self.headers)
-        await downloader.download(master_url, video_file)
-
+        downloader = VideoDownloader(
+            self.__session,
+            self.headers,
+            bandwidth=self.bandwidth,
+            max_height=self.max_height,
+            cache=self.cache,
+            quiet=quiet,
+            on_size=on_size,
+            gate=gate,
+        )
+        _, subtitles = await asyncio.gather(
+            downloader.download(master_url, video_file), self.subtitles.fetch(ep_sources.tracks)
+        )
+
+        if subtitles:
+            await self._mux_subtitles(video_file, subtitles)
+
+        self.measured_bandwidth = downloader.measured_bandwidth
+        return video_file
+
+    async def play_local(self, video_file: str, video_title: str) -> None:
+        await self._play(video_title, video_file, [])
 
     async def play_file(self, ep_sources: EpisodeSources, video_title: str) -> None:
-        master_file = ep_sources.source
-        sub_file = next((track["file"] for track in ep_sources.tracks if "default" in track), None)
+        video_file, sub_files = await self._playable(ep_sources)
+        await self._play(video_title, video_file, sub_files)
+
+    async def queue_item(self, ep_sources: EpisodeSources, video_title: str, episode: int) -> QueueItem:
+        video_file, sub_files = await self._playable(ep_sources)
+        return QueueItem(video_title, episode, video_file, sub_files)
+
+    async def open_queue(self) -> None:
+        """start one mpv that plays whatever gets enqueued, until close_queue() and the last item ends"""
+        await self._start(["--idle=yes", "--force-window=yes"])
+
+        assert self.mpv
+        self.mpv.on("start-file", self._on_start_file)
+        self.mpv.on("file-loaded", self._on_file_loaded)
+        self.mpv.on("end-file", self._on_end_file)
+        self.mpv.on("property-change", self._on_property_change)
+        await self.mpv.observe("idle-active")
+
+        governor.begin_playback()
+
+        def exited(task: asyncio.Future) -> None:
+            governor.end_playback()
+
+            if not task.cancelled():
+                task.exception()
+
+            self._on_quit()
+            self.__ended.put_nowait(None)
+
+        asyncio.ensure_future(self.mpv.wait()).add_done_callback(exited)
+
+    async def close_queue(self) -> None:
+        """nothing more will be enqueued, mpv quits once it runs out of items"""
+        self.__closed = True
+
+        if self.mpv and self.mpv.properties.get("idle-active"):
+            await self.mpv.quit()
+
+    async def enqueue(self, item: QueueItem) -> None:
+        assert self.mpv
+        self.__queue.append(item)
+        await self.mpv.command("loadfile", item.file, "append-play")
+
+    async def ended(self) -> AsyncIterator[tuple[QueueItem, bool]]:
+        """yields queued items as they end and whether they were watched, stops when mpv exits"""
+        while ended := await self.__ended.get():
+            yield ended
+
+    def _on_start_file(self, _: dict) -> None:
+        self.__current += 1
+
+    def _on_file_loaded(self, _: dict) -> None:
+        assert self.mpv
+        if not 0 <= self.__current < len(self.__queue):
+            return
+
+        item = self.__queue[self.__current]
+        asyncio.ensure_future(self.mpv.set("force-media-title", item.title))
+
+        for i, sub_file in enumerate(item.sub_files):
+            asyncio.ensure_future(self.mpv.command("sub-add", sub_file, "select" if i == 0 else "auto"))
+
+    def _on_property_change(self, msg: dict) -> None:
+        assert self.mpv
+        if msg.get("name") == "idle-active" and msg.get("data") and self.__closed:
+            asyncio.ensure_future(self.mpv.quit())
+
+    def _on_end_file(self, msg: dict) -> None:
+        # quitting is settled in _on_quit once the final position is known
+        if msg.get("reason") != "quit" and 0 <= self.__current < len(self.__queue):
+            self.__ended.put_nowait((self.__queue[self.__current], msg.get("reason") == "eof"))
+
+    def _on_quit(self) -> None:
+        assert self.mpv
+        if self.mpv.eof_reason != "quit" or not 0 <= self.__current < len(self.__queue):
+            return
 
-        self._play(video_title, master_file, sub_file)
+        duration = self.mpv.properties.get("duration") or 0
+        watched = bool(duration) and self.mpv.position >= duration * self.watched_ratio
+        self.__ended.put_nowait((self.__queue[self.__current], watched))
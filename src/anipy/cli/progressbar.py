@@ -1,33 +1,208 @@
+import re
+import shutil
+import sys
+import threading
+import time
+import unicodedata
+
+from typing import TextIO
+
+ESCAPE = re.compile(r"(\033\[[0-9;]*[A-Za-z])|(.)", re.S)
+
+
+def format_size(n: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024 or unit == "GiB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{int(n)} B"
+
+        n /= 1024
+
+    return ""
+
+
+def format_eta(seconds: float) -> str:
+    if seconds == float("inf"):
+        return "--:--"
+
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h}:{m:02}:{s:02}" if h else f"{m:02}:{s:02}"
+
+
+def truncate(line: str, width: int) -> str:
+    """cut line to width terminal columns, escape sequences take none and wide characters two"""
+    out = []
+    used = 0
+
+    for m in ESCAPE.finditer(line):
+        escape, char = m.groups()
+        if escape:
+            out.append(escape)
+            continue
+
+        if unicodedata.combining(char):
+            w = 0
+        else:
+            w = 2 if unicodedata.east_asian_width(char) in "WF" else 1
+
+        if used + w > width:
+            return "".join(out) + "\033[0m"
+
+        used += w
+        out.append(char)
+
+    return line
+
+
+class _Output:
+    """stands in for sys.stdout while bars are drawn, anything printed goes above the live block"""
+
+    def __init__(self, renderer: "ProgressRenderer", stream: TextIO) -> None:
+        self.__renderer = renderer
+        self.__stream = stream
+
+    def write(self, text: str) -> int:
+        return self.__renderer.write(text)
+
+    def __getattr__(self, name: str):
+        # fileno, isatty and the rest, input() checks them to decide on readline
+        return getattr(self.__stream, name)
+
+
+class ProgressRenderer:
+    """draws every running ProgressBar as one block of lines on a fixed frame rate"""
+
+    fps = 10
+
+    def __init__(self) -> None:
+        self.__jobs: list["ProgressBar"] = []
+        self.__lock = threading.Lock()
+        self.__thread: threading.Thread | None = None
+        self.__drawn = 0
+        self.__stream: TextIO = sys.stdout
+
+    def add(self, job: "ProgressBar") -> None:
+        with self.__lock:
+            self.__jobs.append(job)
+
+            if not self.__thread or not self.__thread.is_alive():
+                # every other write to stdout goes through write() until the last bar is done
+                if not isinstance(sys.stdout, _Output):
+                    self.__stream = sys.stdout
+                    sys.stdout = _Output(self, self.__stream)
+
+                self.__thread = threading.Thread(target=self._run, daemon=True)
+                self.__thread.start()
+
+    def write(self, text: str) -> int:
+        with self.__lock:
+            if self.__drawn:
+                # drop the live block, the next frame draws it again below the text
+                self.__stream.write(f"\033[{self.__drawn}F\033[J")
+                self.__drawn = 0
+
+            return self.__stream.write(text)
+
+    def draw(self) -> None:
+        with self.__lock:
+            width = shutil.get_terminal_size().columns
+            out = f"\033[{self.__drawn}F\033[J" if self.__drawn else ""
+
+            # finished jobs get their final line written once, above the live block
+            done = [job for job in self.__jobs if job.done]
+            self.__jobs = [job for job in self.__jobs if not job.done]
+
+            for job in done + self.__jobs:
+                out += job.render(width) + "\n"
+
+            self.__drawn = len(self.__jobs)
+
+            self.__stream.write(out)
+            self.__stream.flush()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(1 / self.fps)
+            self.draw()
+
+            with self.__lock:
+                if not self.__jobs:
+                    if isinstance(sys.stdout, _Output):
+                        sys.stdout = self.__stream
+
+                    self.__thread = None
+                    return
+
+
+_renderer = ProgressRenderer()
+
+
 class ProgressBar:
     padding = 5
     fill = "="
 
-    def __init__(self, max: int, title: str) -> None:
+    def __init__(self, max: int, title: str, quiet: bool = False) -> None:
+        """max = 0 for an unknown total, the bar then only counts bytes until close()"""
         self.title = title
+        self.quiet = quiet
+        self.done = False
+
         self.__max = max
         self.__current = 0
-        self.update()
+        self.__bytes = 0
+        self.__started = time.monotonic()
+
+        if not quiet:
+            _renderer.add(self)
+
+    def update(self, n: int = 1, nbytes: int = 0) -> None:
+        """advance by n units, nbytes of them transferred. only counts, drawing happens on the renderer's clock"""
+        self.__current += n
+        self.__bytes += nbytes
+
+        if not self.__max:
+            return
 
-    def update(self) -> None:
         if self.__current > self.__max:
             raise ValueError("current value is more than it should be")
 
-        bar_width = len(self.title) + self.padding * 2
+        if self.__current == self.__max:
+            self.close()
 
-        perc = self.__current / self.__max
-        units = round(bar_width * perc)
+    def close(self) -> None:
+        """finish the bar where it is, also when the transfer failed or its size was unknown"""
+        if self.done:
+            return
+
+        self.done = True
+
+        if not self.quiet:
+            _renderer.draw()
 
-        if not hasattr(self, "_bar_content"):
-            self._bar_content = [" "] * self.padding + list(self.title) + [" "] * self.padding
+    def render(self, width: int) -> str:
+        bar = list(" " * self.padding + self.title + " " * self.padding)
+        elapsed = time.monotonic() - self.__started
+
+        if not self.__max:
+            line = f"[{''.join(bar)}] {format_size(self.__bytes)}"
+            if elapsed > 0 and self.__bytes:
+                line += f"  {format_size(self.__bytes / elapsed)}/s  {'in ' if self.done else ''}{format_eta(elapsed)}"
+
+            return truncate(line, width)
+
+        perc = self.__current / self.__max
+        units = round(len(bar) * perc)
 
         for i in range(units):
-            c = self._bar_content[i]
-            self._bar_content[i] = f"\033[2m{self.fill}\033[0m" if c == " " else c
+            bar[i] = f"\033[2m{self.fill}\033[0m" if bar[i] == " " else bar[i]
 
-        print(f"\r[{''.join(self._bar_content)}] {perc:.2%}", end="")
+        line = f"[{''.join(bar)}] {perc:.2%}"
 
-        if self.__current == self.__max:
-            print()
+        if elapsed > 0 and self.__current:
+            if self.__bytes:
+                line += f"  {format_size(self.__bytes / elapsed)}/s"
 
-        else:
-            self.__current += 1
+            eta = 0.0 if self.done else elapsed / perc - elapsed
+            line += f"  {'in ' + format_eta(elapsed) if self.done else 'eta ' + format_eta(eta)}"
+
+        return truncate(line, width)
@@ -0,0 +1,305 @@
+import asyncio
+import aiohttp
+import hashlib
+import os
+import re
+
+from aiohttp import web
+from typing import Callable
+from urllib import parse
+
+from .governor import TrafficClass, governor
+from .m3u8 import ByteRange, MasterPlaylist, MediaPlaylist, Rendition, Segment, Variant, \
+    is_master, parse_attributes, parse_master, parse_media
+
+
+class SegmentCache:
+    """on-disk cache of raw (still encrypted) HLS segments, evicts least recently used files over budget"""
+
+    def __init__(self, path: str, budget: int) -> None:
+        self.path = path
+        self.budget = budget
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        self.__size = sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+
+    @staticmethod
+    def key(url: str, byterange: ByteRange | None = None) -> str:
+        r = byterange.header if byterange else ""
+        return hashlib.sha1(f"{url}|{r}".encode()).hexdigest()
+
+    def file(self, url: str, byterange: ByteRange | None = None) -> str:
+        return os.path.join(self.path, self.key(url, byterange))
+
+    def get(self, url: str, byterange: ByteRange | None = None) -> bytes | None:
+        path = self.file(url, byterange)
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+
+        except FileNotFoundError:
+            return None
+
+        os.utime(path)
+        return data
+
+    def put(self, url: str, byterange: ByteRange | None, data: bytes) -> None:
+        if len(data) > self.budget:
+            return
+
+        path = self.file(url, byterange)
+        if os.path.exists(path):
+            return
+
+        with open(f"{path}.part", "wb") as f:
+            f.write(data)
+
+        os.replace(f"{path}.part", path)
+        self.__size += len(data)
+
+        if self.__size > self.budget:
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(
+            (e for e in os.scandir(self.path) if e.is_file() and not e.name.endswith(".part")),
+            key=lambda e: e.stat().st_mtime,
+        )
+
+        for e in entries:
+            if self.__size <= self.budget * 0.9:
+                break
+
+            size = e.stat().st_size
+            os.remove(e.path)
+            self.__size -= size
+
+
+class HLSProxy:
+    """local http server mpv plays from: rewrites playlists to point back at itself and serves segments from the cache"""
+
+    host = "127.0.0.1"
+    prefetch = 6
+
+    def __init__(
+            self,
+            session: aiohttp.ClientSession,
+            headers: dict,
+            cache: SegmentCache,
+            *,
+            select: Callable[[MasterPlaylist], tuple[Variant, Rendition | None]] | None = None,
+        ) -> None:
+        self.session = session
+        self.headers = headers
+        self.cache = cache
+        self.select = select
+        self.port = 0
+
+        self.__runner: web.AppRunner | None = None
+        self.__inflight: dict[str, asyncio.Task[bytes]] = {}
+        self.__order: dict[str, tuple[list[Segment], int]] = {}
+        self.__prefetching: set[asyncio.Task] = set()
+        self.__wanted: set[str] = set()
+        self.__prefetch_sem = asyncio.Semaphore(self.prefetch // 2 or 1)
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/playlist", self._playlist)
+        app.router.add_get("/segment", self._segment)
+
+        self.__runner = web.AppRunner(app, access_log=None)
+        await self.__runner.setup()
+
+        site = web.TCPSite(self.__runner, self.host, 0)
+        await site.start()
+
+        # bound to port 0, the os picked one
+        self.port = self.__runner.addresses[0][1]
+
+    async def close(self) -> None:
+        for task in self.__prefetching:
+            task.cancel()
+
+        if self.__runner:
+            await self.__runner.cleanup()
+
+    async def __aenter__(self) -> "HLSProxy":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    def playlist_url(self, url: str) -> str:
+        return f"http://{self.host}:{self.port}/playlist?" + parse.urlencode({"u": url})
+
+    def segment_url(self, url: str, byterange: ByteRange | None = None) -> str:
+        query = {"u": url}
+        if byterange:
+            query["r"] = f"{byterange.length}@{byterange.offset}"
+
+        return f"http://{self.host}:{self.port}/segment?" + parse.urlencode(query)
+
+    async def _get(self, url: str, byterange: ByteRange | None, traffic: TrafficClass) -> bytes:
+        headers = self.headers | {"Range": byterange.header} if byterange else self.headers
+        key = SegmentCache.key(url, byterange)
+        data = bytearray()
+
+        async with self.session.get(url, headers=headers) as resp:
+            # a 200 to a range request is the whole file, cached under the range's key it would poison later reads
+            if resp.status not in ((206,) if byterange else (200, 206)):
+                raise web.HTTPBadGateway(reason=f"upstream returned {resp.status}")
+
+            async for chunk in resp.content.iter_chunked(1 << 16):
+                # a prefetch mpv is already waiting for is no longer background traffic
+                await governor.consume(TrafficClass.INTERACTIVE if key in self.__wanted else traffic, len(chunk))
+                data += chunk
+
+        return bytes(data)
+
+    async def fetch(self, url: str, byterange: ByteRange | None = None, traffic: TrafficClass = TrafficClass.INTERACTIVE) -> bytes:
+        data = self.cache.get(url, byterange)
+        if data is not None:
+            return data
+
+        key = SegmentCache.key(url, byterange)
+
+        if key not in self.__inflight:
+            self.__inflight[key] = asyncio.ensure_future(self._get(url, byterange, traffic))
+
+        if traffic == TrafficClass.INTERACTIVE:
+            self.__wanted.add(key)
+
+        try:
+            data = await asyncio.shield(self.__inflight[key])
+
+        finally:
+            self.__wanted.discard(key)
+
+            if self.__inflight.get(key) and self.__inflight[key].done():
+                self.__inflight.pop(key)
+
+        self.cache.put(url, byterange, data)
+        return data
+
+    def _rewrite_uri(self, line: str, as_playlist: bool, base: str) -> str:
+        def sub(m: re.Match) -> str:
+            url = parse.urljoin(base, m.group(1))
+            return f'URI="{self.playlist_url(url) if as_playlist else self.segment_url(url)}"'
+
+        return re.sub(r'URI="([^"]+)"', sub, line)
+
+    def _rewrite_master(self, url: str, text: str) -> str:
+        keep = None
+        if self.select:
+            variant, _ = self.select(parse_master(url, text))
+            keep = variant.uri
+
+        out = []
+        stream_inf = None
+
+        for line in text.splitlines():
+            if line.startswith("#EXT-X-STREAM-INF:"):
+                stream_inf = line
+                continue
+
+            if line.startswith("#EXT-X-I-FRAME-STREAM-INF:"):
+                continue
+
+            if line.startswith("#EXT-X-MEDIA:"):
+                line = self._rewrite_uri(line, True, url)
+
+            elif line.strip() and not line.startswith("#"):
+                uri = parse.urljoin(url, line.strip())
+                if stream_inf is None or keep and uri != keep:
+                    stream_inf = None
+                    continue
+
+                out.append(stream_inf)
+                line = self.playlist_url(uri)
+                stream_inf = None
+
+            out.append(line)
+
+        return "\n".join(out) + "\n"
+
+    def _rewrite_media(self, playlist: MediaPlaylist, text: str) -> str:
+        out = []
+        segments = iter(playlist.segments)
+
+        for line in text.splitlines():
+            if line.startswith("#EXT-X-BYTERANGE"):
+                continue
+
+            if line.startswith("#EXT-X-KEY:"):
+                line = self._rewrite_uri(line, False, playlist.url)
+
+            elif line.startswith("#EXT-X-MAP:"):
+                attrs = parse_attributes(line.split(":", 1)[1])
+                uri = parse.urljoin(playlist.url, attrs["URI"])
+                byterange = ByteRange.parse(attrs["BYTERANGE"]) if "BYTERANGE" in attrs else None
+                line = f'#EXT-X-MAP:URI="{self.segment_url(uri, byterange)}"'
+
+            elif line.strip() and not line.startswith("#"):
+                segment = next(segments)
+                line = self.segment_url(segment.uri, segment.byterange)
+
+            out.append(line)
+
+        return "\n".join(out) + "\n"
+
+    async def _playlist(self, request: web.Request) -> web.Response:
+        url = request.query["u"]
+
+        async with self.session.get(url, headers=self.headers) as resp:
+            if resp.status != 200:
+                raise web.HTTPBadGateway(reason=f"upstream returned {resp.status}")
+
+            text = await resp.text()
+
+        if is_master(text):
+            body = self._rewrite_master(url, text)
+
+        else:
+            playlist = parse_media(url, text)
+            for i, segment in enumerate(playlist.segments):
+                self.__order[SegmentCache.key(segment.uri, segment.byterange)] = (playlist.segments, i)
+
+            body = self._rewrite_media(playlist, text)
+
+        return web.Response(text=body, content_type="application/vnd.apple.mpegurl")
+
+    def _schedule_prefetch(self, key: str) -> None:
+        if key not in self.__order:
+            return
+
+        segments, index = self.__order[key]
+
+        for segment in segments[index + 1 : index + 1 + self.prefetch]:
+            k = SegmentCache.key(segment.uri, segment.byterange)
+            if k in self.__inflight or os.path.exists(self.cache.file(segment.uri, segment.byterange)):
+                continue
+
+            task = asyncio.ensure_future(self._prefetch_one(segment))
+            self.__prefetching.add(task)
+            task.add_done_callback(self.__prefetching.discard)
+
+    async def _prefetch_one(self, segment: Segment) -> None:
+        async with self.__prefetch_sem:
+            try:
+                await self.fetch(segment.uri, segment.byterange, TrafficClass.PREFETCH)
+
+            except (aiohttp.ClientError, asyncio.TimeoutError, web.HTTPException):
+                pass
+
+    async def _segment(self, request: web.Request) -> web.Response:
+        url = request.query["u"]
+        byterange = ByteRange.parse(request.query["r"]) if "r" in request.query else None
+
+        data = await self.fetch(url, byterange)
+        self._schedule_prefetch(SegmentCache.key(url, byterange))
+
+        return web.Response(body=data, content_type="application/octet-stream")
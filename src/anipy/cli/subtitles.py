@@ -0,0 +1,69 @@
+import asyncio
+import aiohttp
+import hashlib
+import os
+
+from dataclasses import dataclass
+from urllib import parse
+
+from ..core.exceptions import InvalidResponse, InvalidStatusCode
+
+
+@dataclass
+class Subtitle:
+    path:       str
+    label:      str
+    default:    bool
+
+
+class SubtitleCache:
+    """subtitle tracks stored on disk by url hash, fetched all at once"""
+
+    kinds = ("captions", "subtitles")
+
+    def __init__(self, path: str, session: aiohttp.ClientSession, headers: dict) -> None:
+        self.path = path
+        self.session = session
+        self.headers = headers
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def file(self, url: str) -> str:
+        ext = os.path.splitext(parse.urlparse(url).path)[1] or ".vtt"
+        return os.path.join(self.path, hashlib.sha1(url.encode()).hexdigest() + ext)
+
+    async def _fetch(self, url: str) -> str:
+        path = self.file(url)
+        if os.path.exists(path):
+            return path
+
+        async with self.session.get(url, headers=self.headers) as resp:
+            if resp.status != 200:
+                raise InvalidStatusCode(resp.status, resp.url)
+
+            data = await resp.read()
+
+        with open(f"{path}.part", "wb") as f:
+            f.write(data)
+
+        os.replace(f"{path}.part", path)
+        return path
+
+    async def fetch(self, tracks: list[dict]) -> list[Subtitle]:
+        """local copies of subtitle tracks, default track first. tracks that fail to download are left out"""
+        tracks = [t for t in tracks if t.get("file") and t.get("kind", "captions") in self.kinds]
+
+        results = await asyncio.gather(*[self._fetch(t["file"]) for t in tracks], return_exceptions=True)
+        subtitles = []
+
+        for track, result in zip(tracks, results):
+            if isinstance(result, (aiohttp.ClientError, asyncio.TimeoutError, InvalidStatusCode, InvalidResponse)):
+                continue
+
+            if isinstance(result, BaseException):
+                raise result
+
+            subtitles.append(Subtitle(result, track.get("label", ""), bool(track.get("default"))))
+
+        return sorted(subtitles, key=lambda s: not s.default)
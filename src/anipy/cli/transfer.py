@@ -0,0 +1,248 @@
+import asyncio
+import aiohttp
+import math
+import re
+import time
+
+from dataclasses import dataclass
+from typing import Callable, Literal
+from urllib import parse
+
+from ..core.exceptions import InvalidResponse, InvalidStatusCode
+from .governor import TrafficClass, iter_governed
+from .writer import AsyncFile, BufferedWriter
+
+
+class AIMDController:
+    """additive-increase/multiplicative-decrease limit for concurrent segment fetches"""
+
+    initial = 4
+    minimum = 1
+    maximum = 32
+
+    def __init__(self) -> None:
+        self.__limit = float(self.initial)
+        self.__in_flight = 0
+        self.__cond = asyncio.Condition()
+
+        self.__throughput = 0.0
+        self.__peak_throughput = 0.0
+        self.__last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        return max(self.minimum, min(self.maximum, int(self.__limit)))
+
+    @property
+    def throughput(self) -> float:
+        return self.__throughput
+
+    async def acquire(self) -> None:
+        async with self.__cond:
+            await self.__cond.wait_for(lambda: self.__in_flight < self.limit)
+            self.__in_flight += 1
+
+    async def release(self, nbytes: int, elapsed: float, failed: bool) -> None:
+        if failed:
+            self._decrease()
+
+        elif elapsed > 0:
+            self._on_sample(nbytes / elapsed)
+
+        # the slot is given back before awaiting anything, so a release cancelled on the lock can't leak it
+        self.__in_flight -= 1
+
+        async with self.__cond:
+            self.__cond.notify_all()
+
+    def _on_sample(self, throughput: float) -> None:
+        self.__throughput = throughput if not self.__throughput else self.__throughput * 0.8 + throughput * 0.2
+        self.__peak_throughput = max(self.__peak_throughput * 0.99, self.__throughput)
+
+        # per-segment throughput collapsing while the window is large means the
+        # link or the CDN is saturated, back off the same way as on errors
+        if self.__throughput < self.__peak_throughput * 0.5 and self.limit > self.minimum:
+            self._decrease()
+
+        else:
+            self.__limit = min(self.maximum, self.__limit + 1 / self.__limit)
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+
+        # one in-flight window usually fails together, halve only once for it
+        if now - self.__last_decrease < 1:
+            return
+
+        self.__last_decrease = now
+        self.__limit = max(self.minimum, self.__limit / 2)
+        self.__peak_throughput = self.__throughput
+
+
+type SourceKind = Literal["hls", "progressive"]
+
+
+def sniff_source(url: str, content_type: str, head: bytes) -> SourceKind:
+    if head.removeprefix(b"\xef\xbb\xbf").lstrip().startswith(b"#EXTM3U"):
+        return "hls"
+
+    if "mpegurl" in content_type.lower():
+        return "hls"
+
+    if parse.urlparse(url).path.lower().endswith((".m3u8", ".m3u")):
+        return "hls"
+
+    return "progressive"
+
+
+def content_range_size(resp: aiohttp.ClientResponse) -> int | None:
+    if resp.status != 206:
+        return None
+
+    m = re.match(r"bytes \d+-\d+/(\d+)", resp.headers.get("Content-Range", ""))
+    return int(m.group(1)) if m else None
+
+
+async def read_head(resp: aiohttp.ClientResponse, n: int) -> bytes:
+    head = b""
+
+    while len(head) < n:
+        chunk = await resp.content.read(n - len(head))
+        if not chunk:
+            break
+
+        head += chunk
+
+    return head
+
+
+@dataclass
+class _Range:
+    start:  int
+    end:    int
+    pos:    int = -1
+    began:  float = 0.0
+
+    def __post_init__(self) -> None:
+        if self.pos < 0:
+            self.pos = self.start
+
+    @property
+    def remaining(self) -> int:
+        return self.end - self.pos
+
+    @property
+    def eta(self) -> float:
+        elapsed = time.monotonic() - self.began
+        done = self.pos - self.start
+
+        if not self.began or not done:
+            return float("inf")
+
+        return self.remaining / (done / elapsed)
+
+
+class RangedDownloader:
+    """parallel byte-range download of a single file, idle connections steal work from slow ones"""
+
+    connections = 8
+    chunk_size = 1 << 16
+    min_split = 1 << 20
+    # a gated download only pauses between ranges, so they are kept this short
+    gated_range = 1 << 23
+    retries = 5
+    retry_delay = 0.5
+
+    def __init__(
+            self,
+            session: aiohttp.ClientSession,
+            headers: dict,
+            writer: BufferedWriter,
+            traffic: TrafficClass = TrafficClass.BULK,
+            gate: asyncio.Event | None = None,
+        ) -> None:
+        self.headers = headers
+        self.session = session
+        self.writer = writer
+        self.traffic = traffic
+        self.gate = gate
+        self.__ranges: list[_Range] = []
+
+    def _next_range(self) -> _Range | None:
+        pending = [r for r in self.__ranges if not r.began and r.remaining > 0]
+        if pending:
+            return pending[0]
+
+        active = [r for r in self.__ranges if r.remaining >= self.min_split * 2]
+        if not active:
+            return None
+
+        victim = max(active, key=lambda r: (r.eta, r.remaining))
+        mid = victim.pos + victim.remaining // 2
+
+        stolen = _Range(mid, victim.end)
+        victim.end = mid
+        self.__ranges.append(stolen)
+
+        return stolen
+
+    async def _fetch(self, url: str, out: AsyncFile, r: _Range, on_progress: Callable[[int], None]) -> None:
+        r.began = time.monotonic()
+
+        for attempt in range(self.retries):
+            headers = self.headers | {"Range": f"bytes={r.pos}-{r.end - 1}"}
+
+            try:
+                async with self.session.get(url, headers=headers) as resp:
+                    if resp.status != 206:
+                        raise InvalidStatusCode(resp.status, resp.url)
+
+                    async with out.stream(r.pos) as stream:
+                        async for chunk in iter_governed(resp, self.traffic, self.chunk_size):
+                            chunk = chunk[:r.end - r.pos]
+                            await stream.write(chunk)
+
+                            r.pos += len(chunk)
+                            on_progress(len(chunk))
+
+                            if r.pos >= r.end:
+                                break
+
+                if r.pos >= r.end:
+                    return
+
+                raise InvalidResponse(f"range ended early at {r.pos} (expected {r.end})")
+
+            except (aiohttp.ClientError, asyncio.TimeoutError, InvalidStatusCode, InvalidResponse):
+                if attempt == self.retries - 1:
+                    raise
+
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+    async def _worker(self, url: str, out: AsyncFile, on_progress: Callable[[int], None]) -> None:
+        while r := self._next_range():
+            if self.gate:
+                await self.gate.wait()
+
+            await self._fetch(url, out, r, on_progress)
+
+    async def download(self, url: str, path: str, size: int, on_progress: Callable[[int], None], head: bytes = b"") -> None:
+        out = await self.writer.open(path, size)
+
+        async with out:
+            await out.write_at(0, head)
+            on_progress(len(head))
+
+            offset = len(head)
+            if offset >= size:
+                # small enough that the sniffed head was the whole file
+                return
+
+            part = max(1, math.ceil((size - offset) / self.connections))
+            if self.gate:
+                part = min(part, self.gated_range)
+
+            self.__ranges = [_Range(start, min(start + part, size)) for start in range(offset, size, part)]
+
+            workers = min(self.connections, len(self.__ranges))
+            await asyncio.gather(*[self._worker(url, out, on_progress) for _ in range(workers)])
@@ -0,0 +1,144 @@
+import asyncio
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+class BufferedWriter:
+    """file writes queued to one dedicated thread, so the event loop never waits on the disk.
+    jobs run in submission order; readers are held back once too much data is queued"""
+
+    buffer_size = 1 << 20
+    max_pending = 64 << 20
+
+    def __init__(self) -> None:
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="anipy-writer")
+        self.__pending = 0
+        self.__released = asyncio.Event()
+
+    async def _submit[T](self, nbytes: int, func: Callable[..., T], *args) -> asyncio.Future[T]:
+        # one oversized job is let through alone rather than waiting forever
+        while self.__pending and self.__pending + nbytes > self.max_pending:
+            self.__released.clear()
+            await self.__released.wait()
+
+        self.__pending += nbytes
+        future = asyncio.get_running_loop().run_in_executor(self.__executor, func, *args)
+
+        def release(_) -> None:
+            self.__pending -= nbytes
+            self.__released.set()
+
+        future.add_done_callback(release)
+        return future
+
+    async def run[T](self, func: Callable[..., T], *args) -> T:
+        """run blocking file work on the writer thread, after everything queued before it"""
+        return await (await self._submit(0, func, *args))
+
+    async def open(self, path: str, size: int = 0, mode: str = "wb") -> "AsyncFile":
+        def _open() -> int:
+            flags = os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0)
+            if mode == "wb":
+                flags |= os.O_TRUNC
+
+            fd = os.open(path, flags, 0o644)
+
+            if size:
+                try:
+                    os.posix_fallocate(fd, 0, size)
+
+                except (AttributeError, OSError):
+                    os.ftruncate(fd, size)
+
+            return fd
+
+        return AsyncFile(self, await self.run(_open))
+
+    def close(self) -> None:
+        # every file is synced and closed by now, nothing left to wait for
+        self.__executor.shutdown(wait=False)
+
+
+def _pwrite(fd: int, data: bytes, offset: int) -> None:
+    view = memoryview(data)
+
+    while view:
+        if hasattr(os, "pwrite"):
+            n = os.pwrite(fd, view, offset)
+
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            n = os.write(fd, view)
+
+        view = view[n:]
+        offset += n
+
+
+class AsyncFile:
+    def __init__(self, writer: BufferedWriter, fd: int) -> None:
+        self.writer = writer
+        self.fd = fd
+        self.__writes: list[asyncio.Future] = []
+
+    def _check(self) -> None:
+        for future in [f for f in self.__writes if f.done()]:
+            self.__writes.remove(future)
+            future.result()
+
+    async def write_at(self, offset: int, data: bytes) -> None:
+        """queue a write and return once it's accepted, failures surface on a later call or on sync()"""
+        self._check()
+        self.__writes.append(await self.writer._submit(len(data), _pwrite, self.fd, data, offset))
+
+    async def sync(self) -> None:
+        """wait for every queued write of this file"""
+        writes, self.__writes = self.__writes, []
+        await asyncio.gather(*writes)
+
+    def stream(self, offset: int = 0) -> "Stream":
+        return Stream(self, offset)
+
+    async def close(self) -> None:
+        try:
+            await self.sync()
+
+        finally:
+            await self.writer.run(os.close, self.fd)
+
+    async def __aenter__(self) -> "AsyncFile":
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+
+class Stream:
+    """sequential writes from an offset, coalesced into buffer_size blocks"""
+
+    def __init__(self, file: AsyncFile, offset: int) -> None:
+        self.file = file
+        self.offset = offset
+        self.__buffer = bytearray()
+
+    async def write(self, data: bytes) -> None:
+        self.__buffer += data
+
+        if len(self.__buffer) >= self.file.writer.buffer_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self.__buffer:
+            return
+
+        data, self.__buffer = bytes(self.__buffer), bytearray()
+        offset, self.offset = self.offset, self.offset + len(data)
+
+        await self.file.write_at(offset, data)
+
+    async def __aenter__(self) -> "Stream":
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.flush()
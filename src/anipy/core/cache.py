@@ -0,0 +1,216 @@
+import os
+import json
+import atexit
+import sqlite3
+import threading
+import time
+import inspect
+import functools
+
+from collections import OrderedDict
+
+from .types import Serializable
+
+
+def get_user_cache_dir() -> str:
+    if os.name == "posix":
+        path = os.path.join(os.environ["HOME"], ".cache", "anipy")
+    else:
+        path = os.path.join(os.environ["LOCALAPPDATA"], "anipy", "cache")
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    return path
+
+
+class PersistentCache:
+    """small sqlite key/value store for results worth keeping across runs, trimmed to the
+    most recently used max_entries. kept apart from core.data so providers can use it"""
+
+    max_entries = 20000
+    prune_every = 256
+    # accessed_at only orders the pruning, hits are written back in batches off the calling thread
+    touch_batch = 64
+
+    def __init__(self, path: str | None = None) -> None:
+        self.__path = path
+        self.__con: sqlite3.Connection | None = None
+        self.__lock = threading.Lock()
+        self.__writes = 0
+        self.__touched: dict[tuple[str, str], float] = {}
+
+        atexit.register(self.flush)
+
+    def _con(self) -> sqlite3.Connection:
+        if self.__con is None:
+            path = self.__path or os.path.join(get_user_cache_dir(), "cache.db")
+
+            self.__con = sqlite3.connect(path, check_same_thread=False, timeout=5)
+            # a lost write only costs a recomputation, no need to sync the disk on every commit
+            self.__con.execute("PRAGMA journal_mode=WAL")
+            self.__con.execute("PRAGMA synchronous=NORMAL")
+            self.__con.execute("""
+                CREATE TABLE IF NOT EXISTS memo (
+                    namespace   TEXT,
+                    key         TEXT,
+                    value       TEXT NOT NULL,
+                    expires_at  REAL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            self.__con.commit()
+
+        return self.__con
+
+    def get(self, namespace: str, key: str) -> Serializable | None:
+        entry = self.entry(namespace, key)
+        return entry[0] if entry else None
+
+    def entry(self, namespace: str, key: str) -> tuple[Serializable, float | None] | None:
+        """value and expiry time (None if it never expires) of a live entry"""
+        now = time.time()
+
+        with self.__lock:
+            con = self._con()
+            row = con.execute(
+                "SELECT value, expires_at FROM memo WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            if row[1] is not None and row[1] < now:
+                con.execute("DELETE FROM memo WHERE namespace = ? AND key = ?", (namespace, key))
+                con.commit()
+                return None
+
+            self.__touched[namespace, key] = now
+            if len(self.__touched) >= self.touch_batch:
+                threading.Thread(target=self.flush, daemon=True).start()
+
+        return json.loads(row[0]), row[1]
+
+    def set(self, namespace: str, key: str, value: Serializable, ttl: float | None = None) -> None:
+        now = time.time()
+
+        with self.__lock:
+            con = self._con()
+            con.execute(
+                "INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), now + ttl if ttl else None, now),
+            )
+
+            self.__writes += 1
+            if self.__writes % self.prune_every == 0:
+                self._write_touched(con)
+                self._prune(con, now)
+
+            con.commit()
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self.__lock:
+            con = self._con()
+            con.execute("DELETE FROM memo WHERE namespace = ? AND key = ?", (namespace, key))
+            con.commit()
+
+    def flush(self) -> None:
+        """write back the pending accessed_at updates"""
+        with self.__lock:
+            if self.__touched:
+                self._write_touched(self._con())
+                self.__con.commit()
+
+    def _write_touched(self, con: sqlite3.Connection) -> None:
+        touched, self.__touched = self.__touched, {}
+        con.executemany(
+            "UPDATE memo SET accessed_at = ? WHERE namespace = ? AND key = ?",
+            [(at, namespace, key) for (namespace, key), at in touched.items()],
+        )
+
+    def _prune(self, con: sqlite3.Connection, now: float) -> None:
+        con.execute("DELETE FROM memo WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
+        con.execute("""
+            DELETE FROM memo WHERE rowid IN (
+                SELECT rowid FROM memo ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+
+persistent_cache = PersistentCache()
+
+
+def memo(namespace: str, *, ttl: float | None = None, size: int = 256):
+    """memoize a deterministic function (sync or async) of json-serializable arguments, in
+    memory up to size entries and in the persistent cache behind that. the wrapper's
+    invalidate(*args, **kwargs) drops one entry"""
+
+    def decorator(func):
+        recent: OrderedDict[str, tuple[Serializable, float]] = OrderedDict()
+
+        def make_key(args, kwargs) -> str:
+            return json.dumps([args, sorted(kwargs.items())])
+
+        def lookup(args, kwargs) -> tuple[str, Serializable | None]:
+            key = make_key(args, kwargs)
+
+            if key in recent:
+                value, expires_at = recent[key]
+                if expires_at > time.time():
+                    recent.move_to_end(key)
+                    return key, value
+
+                del recent[key]
+
+            entry = persistent_cache.entry(namespace, key)
+            if entry is None:
+                return key, None
+
+            # keep the expiry it was stored with, a hit doesn't extend it
+            value, expires_at = entry
+            remember(key, value, float("inf") if expires_at is None else expires_at)
+
+            return key, value
+
+        def remember(key: str, value: Serializable, expires_at: float) -> None:
+            recent[key] = value, expires_at
+            if len(recent) > size:
+                recent.popitem(last=False)
+
+        def store(key: str, value: Serializable) -> None:
+            remember(key, value, time.time() + ttl if ttl else float("inf"))
+            persistent_cache.set(namespace, key, value, ttl)
+
+        def invalidate(*args, **kwargs) -> None:
+            key = make_key(args, kwargs)
+
+            recent.pop(key, None)
+            persistent_cache.delete(namespace, key)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key, value = lookup(args, kwargs)
+                if value is None:
+                    value = await func(*args, **kwargs)
+                    store(key, value)
+
+                return value
+
+            async_wrapper.invalidate = invalidate
+            return async_wrapper
+
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            key, value = lookup(args, kwargs)
+            if value is None:
+                value = func(*args, **kwargs)
+                store(key, value)
+
+            return value
+
+        sync_wrapper.invalidate = invalidate
+        return sync_wrapper
+
+    return decorator
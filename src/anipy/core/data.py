@@ -1,6 +1,7 @@
 import os
 import json
 import sqlite3
+import time
 
 from typing import Literal, get_origin, get_args
 from enum import Enum
@@ -60,9 +61,17 @@ def lock_file_get_content() -> dict:
 
 
 class Config:
-    banner:     list[str]  = ["continue watching", "highlighted"]
-    provider:   Providers  = Providers.ALLMANGA
-    prompt:     str        = "{} > "
+    banner:         list[str]  = ["continue watching", "highlighted"]
+    provider:       Providers  = Providers.ALLMANGA
+    prompt:         str        = "{} > "
+    max_resolution: int        = 0
+    bandwidth:      int        = 0
+    cache_size:     int        = 1024
+    library_dir:    str        = ""
+    library_quota:  int        = 0
+    auto_download:  bool       = False
+    binge_ahead:    int        = 2
+    download_cap:   int        = 0
 
     def __init__(self) -> None:
         self.__path = os.path.join(get_user_config_dir(), "settings.json")
@@ -263,6 +272,34 @@ class Tables:
         }
     )
 
+    DOWNLOADS = DataTable(
+        "downloads",
+        {
+                "id":               "INTEGER NOT NULL",
+                "episode":          "INTEGER NOT NULL",
+
+                "path":             "TEXT NOT NULL",
+                "size":             "INTEGER NOT NULL",
+                "checksum":         "TEXT NOT NULL",
+
+                "downloaded_at":    "INTEGER",
+                "accessed_at":      "INTEGER",
+
+                "PRIMARY KEY (id, episode)": None,
+                "FOREIGN KEY (id) REFERENCES data(id)": None,
+        }
+    )
+
+    SUBSCRIPTIONS = DataTable(
+        "subscriptions",
+        {
+                "id":               "INTEGER PRIMARY KEY",
+                "subscribed_at":    "INTEGER",
+
+                "FOREIGN KEY (id) REFERENCES data(id)": None,
+        }
+    )
+
 
 class Data(DBManager):
     def __init__(self) -> None:
@@ -273,6 +310,8 @@ class Data(DBManager):
 
         self.create_table(Tables.DATA.name, Tables.DATA.scheme)
         self.create_table(Tables.IDS.name, Tables.IDS.scheme)
+        self.create_table(Tables.DOWNLOADS.name, Tables.DOWNLOADS.scheme)
+        self.create_table(Tables.SUBSCRIPTIONS.name, Tables.SUBSCRIPTIONS.scheme)
 
 
     @property
@@ -293,6 +332,52 @@ class Data(DBManager):
         srted = sorted(d, key=lambda o: o['added_at'])
         return DataList(srted)
 
+    def get_download(self, id: int, episode: int) -> dict | None:
+        row = self.select_one(Tables.DOWNLOADS.name, {"id": id, "episode": episode})
+        if not row:
+            return None
+
+        # the file may have been moved or deleted outside of anipy
+        if not os.path.isfile(row["path"]) or os.path.getsize(row["path"]) != row["size"]:
+            self.delete(Tables.DOWNLOADS.name, {"id": id, "episode": episode})
+            return None
+
+        return row
+
+    def add_download(self, id: int, episode: int, path: str, checksum: str) -> None:
+        self.delete(Tables.DOWNLOADS.name, {"id": id, "episode": episode})
+        self.insert(Tables.DOWNLOADS.name, {
+            "id": id,
+            "episode": episode,
+            "path": os.path.abspath(path),
+            "size": os.path.getsize(path),
+            "checksum": checksum,
+            "downloaded_at": int(time.time()),
+            "accessed_at": int(time.time()),
+        })
+
+    def touch_download(self, id: int, episode: int) -> None:
+        self.update(Tables.DOWNLOADS.name, {"accessed_at": int(time.time())}, {"id": id, "episode": episode})
+
+    def remove_download(self, id: int, episode: int) -> None:
+        row = self.select_one(Tables.DOWNLOADS.name, {"id": id, "episode": episode})
+        if row and os.path.isfile(row["path"]):
+            os.remove(row["path"])
+
+        self.delete(Tables.DOWNLOADS.name, {"id": id, "episode": episode})
+
+    def is_subscribed(self, id: int) -> bool:
+        return self.select_one(Tables.SUBSCRIPTIONS.name, {"id": id}) is not None
+
+    def subscribe(self, id: int) -> None:
+        if not self.is_subscribed(id):
+            self.insert(Tables.SUBSCRIPTIONS.name, {"id": id, "subscribed_at": int(time.time())})
+
+    def unsubscribe(self, id: int) -> None:
+        self.delete(Tables.SUBSCRIPTIONS.name, {"id": id})
+
     def remove_anime(self, anime: DataObject) -> None:
+        self.delete(Tables.SUBSCRIPTIONS.name, {"id": anime.id})
+        self.delete(Tables.DOWNLOADS.name, {"id": anime.id})
         self.delete(Tables.IDS.name, {"id": anime.id})
         self.delete(Tables.DATA.name, {"id": anime.id})
@@ -1,8 +1,13 @@
 class InvalidFrontendPage(Exception): ...
 class InvalidScript(Exception): ...
+class PatternBudgetExceeded(InvalidScript): ...
 
 class InvalidResponse(Exception): ...
 class InvalidStatusCode(Exception): ...
 
 class ProviderUnknown(Exception): ...
 class SelectorNotFound(Exception): ...
+
+class MPVError(Exception): ...
+
+class QuotaExceeded(Exception): ...
@@ -0,0 +1,73 @@
+import asyncio
+import multiprocessing
+import os
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+
+class CPUExecutor:
+    """runs cpu-bound deobfuscation off the event loop, on a thread pool by default: one
+    extraction is a few ms of work, less than spawning a worker process and importing anipy
+    into it. ANIPY_EXECUTOR=process|thread|inline picks the backend, with process the function
+    has to be importable at module level and its arguments and result picklable"""
+
+    kinds = ("process", "thread", "inline")
+
+    def __init__(self, kind: str | None = None, workers: int | None = None) -> None:
+        self.kind = kind or os.getenv("ANIPY_EXECUTOR", "thread")
+        self.workers = workers or min(4, os.cpu_count() or 1)
+
+        if self.kind not in self.kinds:
+            raise ValueError(f"unknown executor kind {self.kind!r}, expected one of {self.kinds}")
+
+        self.__pool: Executor | None = None
+
+    def _pool(self) -> Executor:
+        if self.__pool is None:
+            if self.kind == "process":
+                # forking a process that already runs threads isn't safe, workers start fresh
+                self.__pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+            else:
+                self.__pool = ThreadPoolExecutor(self.workers, thread_name_prefix="anipy-cpu")
+
+        return self.__pool
+
+    def _fall_back(self) -> None:
+        self.close()
+        self.kind = "thread"
+
+    async def run[T](self, func: Callable[..., T], *args) -> T:
+        if self.kind == "inline":
+            return func(*args)
+
+        loop = asyncio.get_running_loop()
+
+        try:
+            future = loop.run_in_executor(self._pool(), func, *args)
+
+        except (OSError, NotImplementedError, BrokenProcessPool):
+            # no usable process support here (sandboxes, some frozen builds)
+            if self.kind != "process":
+                raise
+
+            self._fall_back()
+            return await self.run(func, *args)
+
+        try:
+            return await future
+
+        except BrokenProcessPool:
+            # a worker died, the pool can't be reused
+            self._fall_back()
+            return await self.run(func, *args)
+
+    def close(self) -> None:
+        if self.__pool:
+            self.__pool.shutdown(wait=False, cancel_futures=True)
+            self.__pool = None
+
+
+executor = CPUExecutor()
@@ -0,0 +1,72 @@
+import functools
+import os
+import re
+import time
+
+from enum import StrEnum
+from typing import Callable, NamedTuple
+
+from .exceptions import PatternBudgetExceeded
+
+
+class Formatted(NamedTuple):
+    name:       str
+    compiled:   re.Pattern
+
+
+@functools.lru_cache(maxsize=256)
+def _format(name: str, template: str, values: tuple[tuple[str, str], ...]) -> Formatted:
+    for k, v in values:
+        template = template.replace(f"%%{k}%%", re.escape(v))
+
+    return Formatted(name, re.compile(template))
+
+
+class PatternRegistry(StrEnum):
+    """regex enum compiled once at import. members are never mutated, fmt() fills %%name%%
+    placeholders into a separate compiled pattern, so concurrent callers can't clobber each other"""
+
+    compiled: re.Pattern
+
+    def __init__(self, value: str) -> None:
+        try:
+            self.compiled = re.compile(value)
+
+        except re.error:
+            # _NAMES are fragments other members are built from, not always valid on their own
+            if not self._name_.startswith("_"):
+                raise
+
+    def fmt(self, **kwargs: str) -> Formatted:
+        return _format(self.name, self.value, tuple(sorted(kwargs.items())))
+
+
+class PatternGuard:
+    """optional wall-clock budget for a single match, ANIPY_REGEX_BUDGET in milliseconds (0 = off).
+    re can't be interrupted, so an over-budget match is caught once it returns. that stops the
+    extraction there instead of running the rest of the patterns against a script shape they
+    weren't written for"""
+
+    def __init__(self, budget_ms: float | None = None) -> None:
+        if budget_ms is None:
+            budget_ms = float(os.getenv("ANIPY_REGEX_BUDGET") or 0)
+
+        self.budget = budget_ms / 1000
+
+    def run[T](self, name: str, func: Callable[[str], T], string: str) -> T:
+        if not self.budget:
+            return func(string)
+
+        t = time.perf_counter()
+        v = func(string)
+        elapsed = time.perf_counter() - t
+
+        if elapsed > self.budget:
+            raise PatternBudgetExceeded(
+                f"{name} took {elapsed * 1000:.0f}ms on {len(string)} chars (budget {self.budget * 1000:.0f}ms)"
+            )
+
+        return v
+
+
+guard = PatternGuard()
@@ -0,0 +1,74 @@
+import shutil
+
+from .data import Data, Tables
+from .exceptions import QuotaExceeded
+
+
+class StorageManager:
+    """keeps downloaded episodes within a disk quota, evicting the least useful ones first"""
+
+    # room left on the filesystem no matter what the quota says
+    reserve = 512 << 20
+
+    def __init__(self, data: Data, quota: int, library_dir: str) -> None:
+        self.data = data
+        self.quota = quota
+        self.library_dir = library_dir
+
+    @property
+    def usage(self) -> int:
+        return sum(row["size"] for row in self.data.select_all(Tables.DOWNLOADS.name))
+
+    def _limit(self, usage: int) -> int:
+        free = shutil.disk_usage(self.library_dir).free - self.reserve
+        limit = usage + free
+
+        if self.quota:
+            limit = min(limit, self.quota)
+
+        return limit
+
+    def _candidates(self, keep: set[tuple[int, int]]) -> list[dict]:
+        animes = {a["id"]: a for a in self.data.select_all(Tables.DATA.name)}
+
+        def rank(row: dict) -> tuple[int, int]:
+            anime = animes.get(row["id"])
+
+            if anime is None or anime["status"] in ("completed", "dropped"):
+                tier = 0
+
+            elif row["episode"] < anime["continue_from"]:
+                tier = 1
+
+            else:
+                tier = 2
+
+            return tier, row["accessed_at"] or row["downloaded_at"] or 0
+
+        rows = [r for r in self.data.select_all(Tables.DOWNLOADS.name) if (r["id"], r["episode"]) not in keep]
+        return sorted(rows, key=rank)
+
+    def expected_size(self) -> int:
+        """average episode in the library, for downloads that don't say how big they are"""
+        sizes = [row["size"] for row in self.data.select_all(Tables.DOWNLOADS.name)]
+        return sum(sizes) // len(sizes) if sizes else 0
+
+    def make_room(self, incoming: int = 0, keep: set[tuple[int, int]] | None = None) -> list[dict]:
+        """evict until the library plus `incoming` bytes fits, returns evicted rows. raises
+        QuotaExceeded without evicting anything when `incoming` wouldn't fit even in an empty library"""
+        usage = self.usage
+        limit = self._limit(usage)
+        evicted = []
+
+        if incoming > limit:
+            raise QuotaExceeded(f"{incoming >> 20} MiB doesn't fit in the {limit >> 20} MiB library limit")
+
+        for row in self._candidates(keep or set()):
+            if usage + incoming <= limit:
+                break
+
+            self.data.remove_download(row["id"], row["episode"])
+            usage -= row["size"]
+            evicted.append(row)
+
+        return evicted
@@ -129,3 +129,4 @@ class LockFileKeys(StrEnum):
     DB_LAST_UPDATE = "db_last_updated"
     DB_PAGES = "db_pages"
     WATCHLIST_LAST_REFRESH = "watchlist_last_refresh"
+    MEASURED_BANDWIDTH = "measured_bandwidth"
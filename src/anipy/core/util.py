@@ -8,6 +8,7 @@ import os
 import json
 import inspect
 import functools
+import hashlib
 
 
 def get_user_id() -> str:
@@ -54,6 +55,16 @@ def get_temp_dir() -> str:
     return cache_path
 
 
+def file_checksum(path: str) -> str:
+    h = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
 def compress_data(data: dict) -> str:
     data_string = json.dumps(data)
     data_compressed = zlib.compress(data_string.encode())
@@ -1,14 +1,18 @@
 from typing import Awaitable, Callable
 
 from Crypto.Cipher import AES
+import ast
 import hmac
 import hashlib
 import time
 import base64
 import json
 import aiohttp
+import operator
 import re
 
+from ...core.cache import memo
+from ...core.executor import executor
 from ...core.types import EpisodeSources
 from ...core.exceptions import InvalidFrontendPage, InvalidScript, InvalidResponse
 
@@ -57,6 +61,36 @@ async def resolve_mp4(url: str) -> str:
     
     return m.group()
 
+# an index function: either local `function l(a,b){return g(a-123)}` or global
+# `function g(a,b){return a=a-(12+3),arr()...` over the string array function arr
+FUNCTION_DEF = re.compile(
+    r"function (\w{1,2})\((\w),(\w)\){return "
+    r"(?:(\w{2})\((\w)-([\d\- ]+)\)}|\w=\w-([\(\)\d\-+*\/]+),(\w{2})\(\))"
+)
+
+def _eval_int(expr: str) -> int:
+    """integer arithmetic from the script, without eval"""
+    def ev(node: ast.AST) -> int | float:
+        match node:
+            case ast.Expression(body=body):
+                return ev(body)
+            case ast.Constant(value=int() as v):
+                return v
+            case ast.UnaryOp(op=ast.USub(), operand=operand):
+                return -ev(operand)
+            case ast.BinOp(left=left, op=op, right=right) if type(op) in ARITHMETIC:
+                return ARITHMETIC[type(op)](ev(left), ev(right))
+
+        raise InvalidScript(f"unsupported index expression {expr!r}")
+
+    try:
+        return int(ev(ast.parse(expr.strip(), mode="eval")))
+
+    except SyntaxError:
+        raise InvalidScript(f"unsupported index expression {expr!r}")
+
+ARITHMETIC = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv}
+
 def current_epoch() -> int:
     now = int(time.time())
 
@@ -77,21 +111,11 @@ class AllAnimeCrypto:
 
     @staticmethod
     def derive_key(mask: bytes, xor_key: str) -> bytes:
-        xor_key_b = base64.b64decode(xor_key)
-        key = b""
-        for a, b in zip(xor_key_b, mask):
-            val = a ^ b
-            key += val.to_bytes(1)
-        return key
+        return bytes(a ^ b for a, b in zip(base64.b64decode(xor_key), mask))
 
     @staticmethod
     def _get_build_id_mask(build_id: str) -> bytes:
-        ret = b""
-        for i in range(32):
-            ch = build_id[i % len(build_id)]
-            mask = 255 & (i * 17 + 31)
-            ret += int.to_bytes(ord(ch) ^ mask)
-        return ret
+        return bytes(ord(build_id[i % len(build_id)]) ^ (255 & (i * 17 + 31)) for i in range(32))
 
 
     @staticmethod
@@ -117,36 +141,50 @@ class AllAnimeCrypto:
             raise InvalidScript("array shuffle function not found")
 
         shuffle_func = m.group(1)
+        shuffle_start, shuffle_end = m.span(1)
 
-        sub_index_funcs: dict[str, Callable[[int], int]] = {}
-        index_funcs: dict[str, Callable[[int], int]] = {}
+        # every index function in the script, found in one scan: locals as
+        # (global name, parameter holding the index, offset), globals as offset
+        local_defs: list[tuple[int, str, str, int, int]] = []
+        global_funcs: dict[str, int] = {}
 
-        local_funcs = re.findall(r"function (\w)\(\w,\w\){return (\w{2})\(\w-([\d\- ]+)\)}", shuffle_func)
-        if not local_funcs:
-            raise InvalidScript("no local index functions found")
+        for f in FUNCTION_DEF.finditer(script):
+            name, first_param, _, gname, var, offset, g_offset, g_array = f.groups()
+
+            if gname:
+                local_defs.append((f.start(), name, gname, 0 if first_param == var else 1, _eval_int(offset)))
 
-        local_func_arg = 0
-        for lname, arg, gname, lvalue_var, lvalue_num in local_funcs:
-            local_func_arg = 0 if arg == lvalue_var else 1
+            elif g_array == array_func:
+                global_funcs.setdefault(name, _eval_int(g_offset))
 
-            p_global = r"function " + gname + r"\(\w,\w\){return \w=\w-([\(\)\d\-+*\/]+)," + array_func + r"\(\)"
-            m = re.search(p_global, script)
-            if not m:
-                raise Exception(f"global index function {gname} not found")
+        # shuffle helpers are scoped to the shuffle function, everything else resolves to the first definition
+        shuffle_locals = {name: d for pos, name, *d in local_defs if shuffle_start <= pos < shuffle_end}
+        script_locals: dict[str, tuple[str, int, int]] = {}
+        for _, name, *d in local_defs:
+            script_locals.setdefault(name, tuple(d))
 
-            gv = eval(m.group(1))
-            lv = eval(lvalue_num)
+        if not shuffle_locals:
+            raise InvalidScript("no local index functions found")
+
+        def index(gname: str, value: int) -> int:
+            if gname not in global_funcs:
+                raise InvalidScript(f"global index function {gname} not found")
 
-            index_funcs[gname] = lambda v, _gv=gv: v - _gv
-            sub_index_funcs[lname] = lambda v, _lv=lv, _gn=gname: index_funcs[_gn](v - _lv)
+            return value - global_funcs[gname]
 
-        indexes = [
-            sub_index_funcs[fn](int((val1, val2)[local_func_arg]))
-            for fn, val1, val2 in re.findall(r"parseInt\((\w)\(([-\d]+),([-\d]+)", shuffle_func)
-        ]
+        indexes = []
+        for fn, val1, val2 in re.findall(r"parseInt\((\w)\(([-\d]+),([-\d]+)", shuffle_func):
+            gname, arg, offset = shuffle_locals[fn]
+            indexes.append(index(gname, int((val1, val2)[arg]) - offset) % len(all_items))
 
-        while None in [parse_int(all_items[i]) for i in indexes]:
-            all_items.append(all_items.pop(0))
+        # the array is rotated left until every parseInt in the shuffle sees a number. the rotation
+        # is solved directly: the first r with all items at (i + r) % n parseable
+        parseable = [parse_int(item) is not None for item in all_items]
+        rotation = next((r for r in range(len(all_items)) if all(parseable[(i + r) % len(all_items)] for i in indexes)), None)
+        if rotation is None:
+            raise InvalidScript("array rotation not found")
+
+        all_items = all_items[rotation:] + all_items[:rotation]
 
         m = re.search(r"\w{2}=\[(\w{2}\([^\]]+)", script)
         if not m:
@@ -154,27 +192,24 @@ class AllAnimeCrypto:
 
         mask_indexes = []
         for local_name, value in re.findall(r"([a-zA-Z]{2}).+?([\d-]+)\)", m.group(1)):
-            p_sub = r"function " + local_name + r"\(\w,\w\){return (\w{2})\(\w-([\d\- ]+)\)}"
-            m_ = re.search(p_sub, script)
-            if not m_:
+            if local_name not in script_locals:
                 raise InvalidScript(f"no {local_name} sub index function found")
 
-            global_name = m_.group(1)
-            if global_name not in index_funcs:
+            global_name, _, offset = script_locals[local_name]
+            if global_name not in global_funcs:
                 raise InvalidScript(f"unknown global index function {global_name}")
 
-            mask_indexes.append(index_funcs[global_name](int(value) - int(m_.group(2))))
-
-        mask = b""
-        for i in range(0, len(mask_indexes), 2):
-            p1 = all_items[mask_indexes[i]]
-            p2 = all_items[mask_indexes[i+1]]
-            mask += base64.b64decode(p1 + p2)
+            mask_indexes.append(index(global_name, int(value) - offset))
 
-        return mask
+        return b"".join(
+            base64.b64decode(all_items[mask_indexes[i]] + all_items[mask_indexes[i+1]])
+            for i in range(0, len(mask_indexes), 2)
+        )
 
-    @classmethod
-    async def _process_chunk(cls, chunk_url: str) -> tuple[str, str, bytes]:
+    @staticmethod
+    @memo("allanime.chunk")
+    async def _chunk_params(chunk_url: str) -> list[str]:
+        """build_id and sign key mask (hex) of a chunk. chunk urls are content-hashed, so they never go stale"""
         chunk = await request_get(chunk_url, func=return_text)
 
         build_id_pattern = r'"(\d+)":""'
@@ -183,9 +218,25 @@ class AllAnimeCrypto:
             raise InvalidScript(f"build_id not found (chunk url: {chunk_url})")
 
         build_id = m.group(1)
-        sign_key_mask = cls._get_sign_key_mask(chunk)
+        sign_key_mask = await executor.run(AllAnimeCrypto._get_sign_key_mask, chunk)
 
-        return "k7", build_id, sign_key_mask
+        return [build_id, sign_key_mask.hex()]
+
+    @classmethod
+    async def _process_chunk(cls, chunk_url: str) -> tuple[str, str, bytes]:
+        build_id, sign_key_mask = await cls._chunk_params(chunk_url)
+        return "k7", build_id, bytes.fromhex(sign_key_mask)
+
+    @staticmethod
+    @memo("allanime.app_chunk")
+    async def _chunk_url(app_script_url: str) -> str:
+        app_script = await request_get(app_script_url, func=return_text)
+
+        m = re.findall(r'(\.\./chunks/[\w-]+\.js)', app_script)
+        if not m:
+            raise InvalidScript(f"no chunks found. (script url: {app_script_url})")
+
+        return m[0].replace("..", f"{AllAnimeCrypto.__cdn}/all/mk/_app/immutable/")
 
     @classmethod
     async def get_aa_params(cls) -> tuple[str, str, bytes]:
@@ -201,31 +252,21 @@ class AllAnimeCrypto:
         )
 
         app_pattern    = rf'({cls.__cdn}/all/mk/_app/immutable/entry/app\.[\w-]+\.js)'
-        chunk_pattern  = r'(\.\./chunks/[\w-]+\.js)'
 
         m = re.search(app_pattern, front_end)
         if not m:
             raise InvalidFrontendPage("app .js file not found")
 
-        app_script_url = m.group(1)
-        app_script = await request_get(app_script_url, func=return_text)
-
-        m = re.findall(chunk_pattern, app_script)
-        if not m:
-            raise InvalidScript(f"no chunks found. (script url: {app_script_url})")
-
-        chunk_url = m[0].replace("..", f"{cls.__cdn}/all/mk/_app/immutable/")
+        chunk_url = await cls._chunk_url(m.group(1))
         return await cls._process_chunk(chunk_url)
 
     @classmethod
     def get_sign_key(cls, build_id: str, mask: bytes) -> bytes:
         build_id_mask = cls._get_build_id_mask(build_id)
-        sign_key = b""
-        for i, (b1, b2) in enumerate(zip(build_id_mask, mask)):
-            v1 = b1 ^ b2
-            v2 = 255 & ((i // 8) * 41 + (i % 8) * 7)
-            sign_key += int.to_bytes(v1 ^ v2)
-        return sign_key
+        return bytes(
+            b1 ^ b2 ^ (255 & ((i // 8) * 41 + (i % 8) * 7))
+            for i, (b1, b2) in enumerate(zip(build_id_mask, mask))
+        )
 
     @classmethod
     async def get_aa_crypto(cls, sign_key: bytes, build_id: str, epoch: int, content_lane: str, host: str) -> dict:
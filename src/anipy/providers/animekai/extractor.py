@@ -4,8 +4,13 @@ import re
 import urllib.parse
 import aiohttp
 import base64
+import functools
 from typing import Callable, Literal, Awaitable
 
+from Crypto.Cipher import ARC4
+
+from ...core.cache import memo
+from ...core.executor import executor
 from ...core.types import EpisodeSources
 from ...core.exceptions import InvalidStatusCode, InvalidResponse
 
@@ -124,42 +129,139 @@ def rc4(key: bytes, data: bytes) -> bytes:
     return bytes(out)
 
 
-def apply_rounds(data: bytes, rounds: list, key_transform: Callable[[bytes], bytes] | None = None) -> bytes:
+# every rc4 key in t.py is a constant, so their keystreams are kept and grown as needed
+_keystreams: dict[bytes, bytes] = {}
+
+def keystream(key: bytes, n: int) -> bytes:
+    stream = _keystreams.get(key, b"")
+
+    if len(stream) < n:
+        stream = ARC4.new(key).encrypt(bytes(max(n, 2 * len(stream), 4096)))
+        _keystreams[key] = stream
+
+    return stream[:n]
+
+def xor_bytes(data: bytes, key: bytes) -> bytes:
+    """data xor key repeated over its length"""
+    n = len(data)
+    if not n:
+        return b""
+
+    stream = key * (n // len(key) + 1)
+    return (int.from_bytes(data) ^ int.from_bytes(stream[:n])).to_bytes(n)
+
+def rc4_fast(key: bytes, data: bytes) -> bytes:
+    return xor_bytes(data, keystream(key, len(data)))
+
+def transform_fast(
+        data: bytes,
+        key: bytes,
+        cfg: TransformConfig,
+        *,
+        extra_key: bytes | None = None,
+        pre_xor: bool = False) -> bytes:
+    """transform() with the per-byte op applied by translating every tenth byte at once"""
+    if pre_xor:
+        data = xor_bytes(data, key[:32])
+
+    else:
+        # decrypting skips every other byte of the first 2 * skip
+        data = data[1 : 2 * cfg.skip : 2] + data[2 * cfg.skip :]
+
+    out = bytearray(data)
+    for r, table in enumerate(cfg.tables):
+        out[r::10] = data[r::10].translate(table)
+
+    if not pre_xor:
+        return xor_bytes(bytes(out), key[:32])
+
+    if extra_key:
+        n = min(cfg.skip, len(out))
+        head = bytearray(2 * n)
+        head[0::2] = extra_key[:n]
+        head[1::2] = out[:n]
+
+        out[:n] = head
+
+    return bytes(out)
+
+def apply_rounds(
+        data: bytes,
+        rounds: list,
+        key_transform: Callable[[bytes], bytes] | None = None,
+        *,
+        reference: bool = False) -> bytes:
     if key_transform is None:
         key_transform = lambda k: k
 
+    rc4_, transform_ = (rc4, transform) if reference else (rc4_fast, transform_fast)
+
     for r in rounds:
         if len(r) == 3:
             rc_key, t_key, cfg = r
-            data = transform(data, key_transform(t_key), cfg) 
-            data = rc4(rc_key, data)
+            data = transform_(data, key_transform(t_key), cfg) 
+            data = rc4_(rc_key, data)
 
         else:
             rc_key, t_key, t_extra_key, cfg = r
-            data = rc4(rc_key, data)
-            data = transform(data, key_transform(t_key), cfg, extra_key=t_extra_key, pre_xor=True) 
+            data = rc4_(rc_key, data)
+            data = transform_(data, key_transform(t_key), cfg, extra_key=t_extra_key, pre_xor=True) 
 
     return data
 
+# cheaper to recompute than a round trip to the persistent cache, keep it in memory only
+@functools.lru_cache(maxsize=1024)
 def encrypt_param(s: str) -> str:
     data = apply_rounds(s.encode(), PARAMS_ROUNDS)
     return base64.urlsafe_b64encode(data).decode()
 
 
+def sources_key_transform(key: bytes, cookie_val: str) -> bytes:
+    user_agent_key = re.sub(r"[^A-Z0-9]", "", USER_AGENT)[-30:]
+    out = list(map(int, key))
+
+    i = 0
+    while i < len(key):
+        out[i] = ord(user_agent_key[i % len(user_agent_key)])
+        i += 4
+
+    i = 0
+    while i < len(key):
+        out[i] = ord(cookie_val[i % len(cookie_val)])
+        i += 6
+
+    return bytes(out)
+
+
+def decrypt_sources_payload(sources: str, cookie_val: str) -> dict:
+    # module level, not a closure, so it can run in a worker process
+    key_transform = functools.partial(sources_key_transform, cookie_val=cookie_val)
+    data = apply_rounds(base64.urlsafe_b64decode(sources + "=="), SOURCES_ROUNDS, key_transform)
+    res = data.decode("latin-1")
+    return json.loads(urllib.parse.unquote(res))
+
+
 class Megaup:
+    # the watch page -> episode token -> data_lid -> iframe chain only changes when new
+    # episodes are added or links rotate, so replays don't repeat the ajax calls
+
     @staticmethod
-    async def get_iframe(url: str, ep: int, ver: str) -> str:
+    @memo("animekai.anime_id")
+    async def get_anime_id(url: str) -> str:
         resp = await request(url, f=to_text)
         m = re.search(r'({"page".+?})', resp)
         if not m:
             raise SyncDataNotFound
 
-        sync_data = json.loads(m.group(1))
+        return json.loads(m.group(1))['anime_id']
 
+    @staticmethod
+    @memo("animekai.tokens", ttl=24 * 3600)
+    async def get_episode_tokens(anime_id: str) -> list[str]:
         list_episodes_url = "https://animekai.to/ajax/episodes/list"
         list_episodes_params = {
-            "ani_id": sync_data['anime_id'],
-            "_": encrypt_param(sync_data['anime_id'])
+            "ani_id": anime_id,
+            "_": encrypt_param(anime_id)
         }
 
         resp = await request(list_episodes_url, params=list_episodes_params, f=to_json)
@@ -169,10 +271,11 @@ class Megaup:
         if not tokens:
             raise EpisodeTokensNotFound
 
-        assert(ep <= len(tokens))
-
-        token = tokens[ep-1]
+        return tokens
 
+    @staticmethod
+    @memo("animekai.lid", ttl=7 * 24 * 3600)
+    async def get_lid(token: str, ver: str) -> str:
         list_links_url = "https://animekai.to/ajax/links/list"
         list_links_params = {
             "token": token,
@@ -186,8 +289,11 @@ class Megaup:
         if not m:
             raise EpisodeNotFound(ver)
 
-        data_lid = m.group(1)
+        return m.group(1)
 
+    @staticmethod
+    @memo("animekai.link", ttl=24 * 3600)
+    async def get_link(data_lid: str) -> str:
         links_view_url = "https://animekai.to/ajax/links/view"
         links_view_params = {
             "id": data_lid,
@@ -197,12 +303,31 @@ class Megaup:
         resp = await request(links_view_url, params=links_view_params, f=to_json)
         return resp['result']
 
+    @classmethod
+    async def get_data_lid(cls, url: str, ep: int, ver: str) -> str:
+        anime_id = await cls.get_anime_id(url)
+        tokens = await cls.get_episode_tokens(anime_id)
+
+        if ep > len(tokens):
+            # episodes added since the list was cached
+            cls.get_episode_tokens.invalidate(anime_id)
+            tokens = await cls.get_episode_tokens(anime_id)
+
+        assert(ep <= len(tokens))
+
+        return await cls.get_lid(tokens[ep-1], ver)
+
     @staticmethod
     def decrypt_iframe(cipher: str) -> dict:
         data = apply_rounds(base64.urlsafe_b64decode(cipher + "=="), IFRAME_ROUNDS)
         res = data.decode("latin-1")
         return json.loads(urllib.parse.unquote(res))
 
+    @staticmethod
+    @memo("animekai.iframe")
+    async def decrypt_iframe_cached(cipher: str) -> dict:
+        return await executor.run(Megaup.decrypt_iframe, cipher)
+
     @staticmethod
     async def decrypt_sources(iframe: str) -> dict:
         resp = await request(iframe, f=to_text)
@@ -228,40 +353,32 @@ class Megaup:
             f=to_json
         )
 
-        user_agent_key = re.sub(r"[^A-Z0-9]", "", USER_AGENT)[-30:]
-
-        def t_key_apply_transform(key: bytes) -> bytes:
-            out = list(map(int, key))
+        return await executor.run(decrypt_sources_payload, resp['result'], cookie_val)
 
-            i = 0
-            while i < len(key):
-                out[i] = ord(user_agent_key[i % len(user_agent_key)])
-                i += 4
 
-            i = 0
-            while i < len(key):
-                out[i] = ord(cookie_val[i % len(cookie_val)])
-                i += 6
-
-            return bytes(out)
+    @classmethod
+    async def extract(cls, url: str, ep: int, ver: Literal['sub', 'softsub', 'dub']) -> EpisodeSources:
+        data_lid = await cls.get_data_lid(url, ep, ver)
 
+        for attempt in range(2):
+            iframe = await cls.get_link(data_lid)
+            embedded = await cls.decrypt_iframe_cached(iframe)
 
-        sources = resp['result']
-        data = apply_rounds(base64.urlsafe_b64decode(sources + "=="), SOURCES_ROUNDS, t_key_apply_transform)
-        res = data.decode("latin-1")
-        return json.loads(urllib.parse.unquote(res))
+            try:
+                sources = await cls.decrypt_sources(embedded['url'])
+                break
 
+            except (InvalidStatusCode, InvalidResponse, ValueError, KeyError):
+                if attempt:
+                    raise
 
-    @classmethod
-    async def extract(cls, url: str, ep: int, ver: Literal['sub', 'softsub', 'dub']) -> EpisodeSources:
-        iframe = await cls.get_iframe(url, ep, ver)
-        embedded = cls.decrypt_iframe(iframe)
+                # the cached link may have rotated since, fetch a fresh one
+                cls.get_link.invalidate(data_lid)
+                cls.decrypt_iframe_cached.invalidate(iframe)
 
         intro = embedded['skip']['intro'][0], embedded['skip']['intro'][1]
         outro = embedded['skip']['outro'][0], embedded['skip']['outro'][1]
 
-        sources = await cls.decrypt_sources(embedded['url'])
-
         return EpisodeSources(
                     sources['sources'][0]['file'],
                     sources['tracks'],
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from functools import cached_property
 from typing import Callable
 import base64
 
@@ -7,6 +8,11 @@ class TransformConfig:
     skip:   int
     ops:    dict[int, Callable[[int], int]]
 
+    @cached_property
+    def tables(self) -> list[bytes]:
+        """ops[r] applied to every byte value, for bytes.translate"""
+        return [bytes(self.ops[r](b) & 0xFF for b in range(256)) for r in range(10)]
+
 #                           rc_key   transform key
 type DataTransform =  tuple[bytes,   bytes,        TransformConfig]
 
@@ -3,12 +3,12 @@ import datetime
 import re
 import aiohttp
 
-from enum import StrEnum
 from html import unescape
 from typing import overload, Literal, Awaitable, Callable, TypeVar
 
 from .extractor import Servers, Megacloud
 from ...core.util import cache
+from ...core.patterns import PatternRegistry, Formatted, guard
 from ...core.exceptions import InvalidResponse
 from ...core.types import SearchObject, AnimeInfo, EpisodeSources, AiringStatus
 
@@ -18,7 +18,7 @@ HEADERS = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/201001
 clean = lambda h: unescape(re.sub(r"\s", " ", h))
 
 
-class Patterns(StrEnum):
+class Patterns(PatternRegistry):
     CARD = r"<div class=\"flw-item\">(.+?)<div class=\"clearfix\"><\/div>"
     POSTER = r"<img.+?src=\"(?P<src>[^\"]+).+?>"
     DYNAMIC_NAME = r"<h3.+?<a href=\"(?P<href>[^\"]+)\" title=\"(?P<title>[^\"]+)\".+?data-jname=\"(?P<jtitle>[^\"]*).+?>"
@@ -40,34 +40,23 @@ class Patterns(StrEnum):
     EPISODE = r"<a title=\"(?P<title>.+?)\".+?data-id=\"(?P<id>\d+).+?data-jname=\"(?P<jtitle>[^\"]*)"
     SERVER = r"<div class=\"item server-item\" data-type=\"sub\" data-id=\"(?P<source_id>\d+)\".+?data-server-id=\"(?P<server_id>\d+)\">"
 
-    def fmt(self, **kwargs) -> "Patterns":
-        for k, v in kwargs.items():
-            v = re.escape(v)
-            self._fmted = self.value.replace(f"%%{k}%%", v)
-
-        return self
-
-    @property
-    def formatted(self) -> str:
-        return getattr(self, "_fmted", self.value)
-
 
 DEFAULT = object()
 T = TypeVar("T")
 
 
 @overload
-def _re(pattern: "Patterns", string: str) -> re.Match: ...
+def _re(pattern: "Patterns | Formatted", string: str) -> re.Match: ...
 @overload
-def _re(pattern: "Patterns", string: str, *, default: T) -> re.Match | T: ...
+def _re(pattern: "Patterns | Formatted", string: str, *, default: T) -> re.Match | T: ...
 @overload
-def _re(pattern: "Patterns", string: str, *, all: Literal[True]) -> list[str]: ...
+def _re(pattern: "Patterns | Formatted", string: str, *, all: Literal[True]) -> list[str]: ...
 @overload
-def _re(pattern: "Patterns", string: str, *, all: Literal[True], default: T) -> list[str] | T: ...
+def _re(pattern: "Patterns | Formatted", string: str, *, all: Literal[True], default: T) -> list[str] | T: ...
 
 
-def _re(pattern: "Patterns", string: str, *, all: bool = False, default: T = DEFAULT) -> re.Match | list[str] | T:
-    v = re.findall(pattern.formatted, string) if all else re.search(pattern.formatted, string)
+def _re(pattern: "Patterns | Formatted", string: str, *, all: bool = False, default: T = DEFAULT) -> re.Match | list[str] | T:
+    v = guard.run(pattern.name, pattern.compiled.findall if all else pattern.compiled.search, string)
 
     if not v and default is DEFAULT:
         msg = f"{pattern.name} not found"
@@ -1,13 +1,18 @@
+import ast
 import asyncio
 import base64
+import functools
+import operator
 import time
 import json
 import re
 import aiohttp
 from urllib import parse
-from typing import Awaitable, Callable, Iterable, TypeVar, overload, Literal, TypeAlias
+from typing import Any, Awaitable, Callable, Iterable, TypeVar, overload, Literal, TypeAlias
 from enum import StrEnum, IntFlag
 
+from ...core.executor import executor
+from ...core.patterns import PatternRegistry, Formatted, guard
 from ...core.types import EpisodeSources
 
 DEFAULT = object()
@@ -24,17 +29,17 @@ class Servers(StrEnum):
     MEGAPLAY =      "9"
 
 @overload
-def _re(pattern: "Patterns", string: str) -> re.Match: ...
+def _re(pattern: "Patterns | Formatted", string: str) -> re.Match: ...
 @overload
-def _re(pattern: "Patterns", string: str, *, default: T) -> re.Match | T: ...
+def _re(pattern: "Patterns | Formatted", string: str, *, default: T) -> re.Match | T: ...
 @overload
-def _re(pattern: "Patterns", string: str, *, all: Literal[True]) -> list: ...
+def _re(pattern: "Patterns | Formatted", string: str, *, all: Literal[True]) -> list: ...
 @overload
-def _re(pattern: "Patterns", string: str, *, all: Literal[True], default: T) -> list | T: ...
+def _re(pattern: "Patterns | Formatted", string: str, *, all: Literal[True], default: T) -> list | T: ...
 
 
-def _re(pattern: "Patterns", string: str, *, all: bool = False, default: T = DEFAULT) -> re.Match | list | T:
-    v = re.findall(pattern.formatted, string) if all else re.search(pattern.formatted, string)
+def _re(pattern: "Patterns | Formatted", string: str, *, all: bool = False, default: T = DEFAULT) -> re.Match | list | T:
+    v = guard.run(pattern.name, pattern.compiled.findall if all else pattern.compiled.search, string)
 
     if not v and default is DEFAULT:
         msg = f"{pattern.name} not found"
@@ -96,6 +101,105 @@ def arr_split(s):
     return parts
 
 
+@functools.lru_cache(maxsize=16)
+def lcg_offsets(seed: int, n: int, bigint: bool) -> list[int]:
+    """(lcg step % 95) * 256 for the first n steps from seed, row offsets into SUBSTITUTIONS"""
+    offsets = [0] * n
+    h = seed
+
+    if bigint:
+        for i in range(n):
+            h = (h * 1103515245 + 12345) & 0x7FFFFFFF
+            offsets[i] = (h % 95) << 8
+
+    else:
+        for i in range(n):
+            h = int(float(h) * 1103515245.0 + 12345.0) & 0x7FFFFFFF
+            offsets[i] = (h % 95) << 8
+
+    return offsets
+
+
+# byte c shifted back by s inside the printable range, at s * 256 + c
+SUBSTITUTIONS = bytes((c - 32 - s) % 95 + 32 for s in range(95) for c in range(256))
+PRINTABLE = bytes(range(32, 127))
+
+
+class _JSArithmetic(ast.NodeTransformer):
+    """checks an expression from the player script and rewrites it to behave like js numbers:
+    shift counts are masked and, unless the script uses bigints, + - * / go through floats.
+    anything but the js operators on constants and args[i] is rejected, ** in particular: the
+    text is remote and 9**9**9 would never finish"""
+
+    allowed = (
+        ast.Expression, ast.BinOp, ast.UnaryOp, ast.Subscript, ast.Constant, ast.Name, ast.Load,
+        ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod,
+        ast.BitAnd, ast.BitOr, ast.BitXor, ast.LShift, ast.RShift,
+        ast.USub, ast.UAdd, ast.Invert,
+    )
+    float_ops = (ast.Add, ast.Sub, ast.Mult, ast.Div)
+
+    def __init__(self, numeric: bool, bigint: bool) -> None:
+        self.numeric = numeric
+        self.bigint = bigint
+
+    def generic_visit(self, node: ast.AST) -> ast.AST:
+        if not isinstance(node, self.allowed):
+            raise ValueError(f"unsupported expression: {type(node).__name__}")
+
+        return super().generic_visit(node)
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        if node.id != "args":
+            raise ValueError(f"unknown name {node.id}")
+
+        return node
+
+    def visit_Constant(self, node: ast.Constant) -> ast.AST:
+        if self.numeric and isinstance(node.value, str) and node.value.isdigit():
+            return ast.Constant(int(node.value))
+
+        if not isinstance(node.value, (int, float, str)):
+            raise ValueError(f"unsupported constant {node.value!r}")
+
+        return node
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.AST:
+        self.generic_visit(node)
+
+        # in every mode, 1 << 10000000 would build a huge int
+        if isinstance(node.op, (ast.LShift, ast.RShift)):
+            node.right = ast.BinOp(node.right, ast.BitAnd(), ast.Constant(31))
+
+        if self.numeric and not self.bigint and isinstance(node.op, self.float_ops):
+            op = ast.BinOp(self._call("float", node.left), node.op, self._call("float", node.right))
+            return self._call("int", op)
+
+        return node
+
+    @staticmethod
+    def _call(func: str, arg: ast.expr) -> ast.Call:
+        return ast.Call(ast.Name(func, ast.Load()), [arg], [])
+
+
+@functools.lru_cache(maxsize=512)
+def compile_expression(source: str, *, numeric: bool = True, bigint: bool = False) -> Callable[..., Any]:
+    """compile an expression over args[i] into a function, once per distinct source"""
+    try:
+        tree = _JSArithmetic(numeric, bigint).visit(ast.parse(source.strip(), mode="eval"))
+
+    except SyntaxError as e:
+        raise ValueError(f"can't parse {source!r}") from e
+
+    func = ast.Expression(ast.Lambda(
+        ast.arguments(posonlyargs=[], args=[], vararg=ast.arg("args"), kwonlyargs=[], kw_defaults=[], defaults=[]),
+        tree.body,
+    ))
+    code = compile(ast.fix_missing_locations(func), "<expression>", "eval")
+
+    return eval(code, {"__builtins__": {}, "int": int, "float": float})
+
+
 def generate_index_sequence(n: int) -> list[int]:
     result = [5, 8, 14, 11]
     if n <= 4:
@@ -116,7 +220,7 @@ class ResolverFlags(IntFlag):
     ABC = 1 << 5
 
 
-class Patterns(StrEnum):
+class Patterns(PatternRegistry):
     _FUNC = r"[\w$]{3}\.[\w$]{2}"
     _FUNC2 = r"[\w$]\.[\w$]{2}"
     _FUNC3 = r"[\w$]{3}\.[\w$]{3}"
@@ -153,13 +257,15 @@ class Patterns(StrEnum):
     GET = f"({GET1}|{GET2}|{GET3}|{GET4}|{GET5}|{GET6})"
 
     ARRAY_CONTENT = r';\w=\[((?!arguments)[\w\d.$\(\)",+]+)\];'
-    KEY_VAR = r"var (?:[\w$]{1,2},){28,}.+?[\w$\.]+=([^;]+?);"
+    # only the last character before = is checked, a whole identifier there made every miss rescan the line
+    KEY_VAR = r"var (?:[\w$]{1,2},){28,}.+?[\w$\.]=([^;]+?);"
 
-    PARSE_INT = r'[\w$]+\({%%value%%},\+?"?16"?'
+    PARSE_INT = r'(?<![\w$])[\w$]++\({%%value%%},\+?"?16"?'
     APPLY_OP = rf"{_FUNC}\((\w+),(\w+)\)"
     APPLY_OP_SPEC = rf'{_FUNC}\("?(\d+)"?,"?(\d+)"?,{_FUNC}\((\d)\)\)'
 
-    GET_KEY_CTX = rf"var (?:[\w$]{{1,2}},?){{28,}};.+?({SET_DEFAULT_OPCODE};\w=.+?)try"
+    # 28+ names, checked by the lookahead instead of by splitting runs of name characters every possible way
+    GET_KEY_CTX = rf"var (?=(?:[\w$],?){{28}})(?:[\w$]+,?)++;.+?({SET_DEFAULT_OPCODE};\w=.+?)try"
     GET_KEY_FUNC = r"(\w)=\(\)=>{(.+?)};"
     GET_KEY_FUNC_RETURN = r"return(.+?);[\}\)]"
     GET_KEY_FUNC_MAP = r"\((\w+)=>{(.+?return.+?;)"
@@ -173,29 +279,75 @@ class Patterns(StrEnum):
     KEY_TRANSFORM_XOR_VALUE = r'[\w$]{2}=[\w$]{5}\(\+?"?(\d+)"?\)'
     KEY_TRANSFORM_SUMMAND = r'[\w$]{2} % [\w$]{2}\[.+?"(\d+)"'
 
-    def fmt(self, **kwargs) -> "Patterns":
-        for k, v in kwargs.items():
-            v = re.escape(v)
-            self._fmted = self.value.replace(f"%%{k}%%", v)
 
-        return self
+class ScriptIndex:
+    """everything the resolvers look up repeatedly, found with one scan of the player script each"""
+
+    # both forms Patterns.VAR knows, for every name at once. values are captured in lookaheads
+    # so assignments nested in another one's value are still found
+    ASSIGNMENT = re.compile(r"(?:^|(?<=[ ;{]))([\w$]+)=(?=([^;]+);)|(?<=[\(,])([\w$]+) = (?=([^\)]+)\))")
+
+    def __init__(self, script: str) -> None:
+        self.script = script
+        self.assignments: dict[str, list[tuple[int, str | None, str | None]]] = {}
+
+        for m in self.ASSIGNMENT.finditer(script):
+            name = m.group(1) or m.group(3)
+            self.assignments.setdefault(name, []).append((m.start(), m.group(2), m.group(4)))
+
+    def var(self, name: str, within: tuple[int, int] | None = None) -> tuple[str | None, str | None]:
+        """first assignment to name, optionally inside a span of the script. one of the two forms is None"""
+        start, end = within or (0, len(self.script))
+
+        for pos, value, value2 in self.assignments.get(name, []):
+            if start <= pos < end:
+                return value, value2
+
+        raise ValueError(f"{Patterns.VAR.name} not found")
+
+    @functools.cached_property
+    def _key_ctx(self) -> re.Match:
+        return _re(Patterns.GET_KEY_CTX, self.script)
+
+    @property
+    def key_ctx(self) -> str:
+        return self._key_ctx.group(1)
 
     @property
-    def formatted(self) -> str:
-        return getattr(self, "_fmted", self.value)
+    def key_ctx_span(self) -> tuple[int, int]:
+        return self._key_ctx.span(1)
+
+    @functools.cached_property
+    def key_funcs(self) -> list[tuple[str, str]]:
+        """(name, body) of every key getter in the key context"""
+        return _re(Patterns.GET_KEY_FUNC, self.key_ctx, all=True)
+
+    @property
+    def key_func(self) -> str:
+        return self.key_funcs[0][1]
+
+    @functools.cached_property
+    def arrays(self) -> list[str]:
+        return _re(Patterns.ARRAY_CONTENT, self.script, all=True)
+
+    @functools.cached_property
+    def operations(self) -> list[tuple[str, str]]:
+        """(case, statement) of the compute op switch"""
+        switch = _re(Patterns.COMPUTE_OP_FUNC, self.script).group(1)
+        return _re(Patterns.OPERATION, switch, all=True)
 
 
 class KeyResolver:
     @staticmethod
     def _get_key(s: "Megacloud") -> str:
-        fcall = _re(Patterns.KEY_VAR, s.script).group(1)
+        fcall = _re(Patterns.KEY_VAR, s.index.script).group(1)
         args = _re(Patterns.GET, fcall).groups()
 
         return s._get(args[1:], fcall).replace("-", "")
 
     @staticmethod
     def _get_keys(s: "Megacloud") -> list[str]:
-        array_items = _re(Patterns.ARRAY_CONTENT, s.script, all=True)[0]
+        array_items = s.index.arrays[0]
         array_items = arr_split(array_items)
         keys = []
 
@@ -210,9 +362,8 @@ class KeyResolver:
 
     @staticmethod
     def _get_indexes(s: "Megacloud") -> list[int]:
-        array_items = _re(Patterns.ARRAY_CONTENT, s.script, all=True)[-1]
-        array_items: list[str] = arr_split(array_items)
-        ctx = _re(Patterns.GET_KEY_CTX, s.script).group(1)
+        array_items: list[str] = arr_split(s.index.arrays[-1])
+        ctx = s.index.key_ctx
         indexes = []
 
         if not any(i.isdigit() for i in array_items):
@@ -261,7 +412,7 @@ class KeyResolver:
     @classmethod
     def abc(cls, s: "Megacloud") -> _KeyPair:
         values = {}
-        ctx = _re(Patterns.GET_KEY_CTX, s.script).group(1)
+        ctx = s.index.key_ctx
 
         for f in _re(Patterns.DICT_SET, ctx, all=True):
             i = 0 if f[0] else 17
@@ -275,7 +426,7 @@ class KeyResolver:
 
             values[k] = v
 
-        get_key_func = _re(Patterns.GET_KEY_FUNC, ctx).group(2)
+        get_key_func = s.index.key_func
 
         order = get_key_func.split("return")[-1].split(";")[0]
         order = order.replace("()", "")
@@ -287,13 +438,12 @@ class KeyResolver:
             v = s._get(indexes, get_key_func)
             order = order.replace(f[0], f'"{values[v]}"')
 
-        key = eval(order)
+        key = compile_expression(order, numeric=False)()
         return list(key), list(range(0, len(key)))
 
     @classmethod
     def add_funcs(cls, s: "Megacloud") -> _KeyPair:
-        ctx = _re(Patterns.GET_KEY_CTX, s.script).group(1)
-        funcs = _re(Patterns.GET_KEY_FUNC, ctx, all=True)
+        funcs = s.index.key_funcs
 
         if len(funcs) < 3:
             return [], []
@@ -311,7 +461,7 @@ class KeyResolver:
     @classmethod
     def from_charcode(cls, s: "Megacloud", keys: list = [], indexes: list = []) -> _KeyPair:
         raw_values = []
-        ctx = _re(Patterns.GET_KEY_CTX, s.script).group(1)
+        ctx = s.index.key_ctx
 
         if indexes:
             raw_values = indexes
@@ -325,7 +475,7 @@ class KeyResolver:
                 opcode = _re(Patterns.SET_DEFAULT_OPCODE, map_body).group(1)
 
                 var_name = apply_op.group(1) if apply_op.group(1) != map_arg else apply_op.group(2)
-                var_value = s._var_to_num(var_name, s.script)
+                var_value = s._var_to_num(var_name, s.index.script)
 
                 raw_values = [s._apply_op((var_value, i), opcode=int(opcode)) for i in raw_values]
 
@@ -345,14 +495,17 @@ class KeyResolver:
 
     @classmethod
     def compute_strings(cls, s: "Megacloud") -> _KeyPair:
-        ctx = _re(Patterns.GET_KEY_CTX, s.script).group(1)
+        ctx = s.index.key_ctx
         ret = _re(Patterns.GET_KEY_FUNC_RETURN, ctx).group(1)
 
         apply_op_args = _re(Patterns.APPLY_OP, ret)
         a, b = apply_op_args.group(1), apply_op_args.group(2)
 
-        a_get = _re(Patterns.VAR.fmt(name=a), ctx).group(1)
-        b_get = _re(Patterns.VAR.fmt(name=b), ctx).group(1)
+        a_get = s.index.var(a, s.index.key_ctx_span)[0]
+        b_get = s.index.var(b, s.index.key_ctx_span)[0]
+
+        if a_get is None or b_get is None:
+            raise ValueError(f"{Patterns.VAR.name} not found")
 
         a_get_args = _re(Patterns.GET, a_get).groups()[1:]
         b_get_args = _re(Patterns.GET, b_get).groups()[1:]
@@ -366,7 +519,7 @@ class KeyResolver:
         if any(c not in HEXDIGITS for c in b_value):
             b_value = base64.b64decode(b_value).decode()
 
-        ctx = _re(Patterns.GET_KEY_FUNC, ctx).group(2)
+        ctx = s.index.key_func
         opcode = _re(Patterns.SET_DEFAULT_OPCODE, ctx).group(1)
 
         key = s.compute_op[int(opcode)](a_value, b_value)
@@ -484,33 +637,25 @@ class Megacloud:
         self.embed_url = embed_url.replace("megacloud.blog", "megacloud.tv")
 
         self.script: str
+        self.index: ScriptIndex
         self.string_array: list[str]
         self.compute_op: dict[int, Callable]
 
-    def _convert_to_js_operation(self, operation: str) -> str:
-        operand = r"\([\w$ *>^+&\[\]]+\)|[\w$]+\[\d\]|int\(.+?\)"
-        multi = rf"({operand}) (\*|\/|\+|-) ({operand})"
-        shift = rf"({operand}) (>>|<<) ({operand})"
-
-        if not self.BIGINT_NUMBERS:
-            while re.search(multi, operation):
-                operation = re.sub(multi, r"int(float(\1) \2 float(\3))", operation)
-
-        while re.search(shift, operation):
-            operation = re.sub(shift, r"\1 \2 (\3 & 31)", operation)
+        # per context string, the script doesn't change during an extraction
+        self.__opcodes: dict[str, list[int]] = {}
+        self.__numbers: dict[tuple[str, str], str] = {}
 
-        return operation
+    def _evaluate(self, expression: str) -> Any:
+        return compile_expression(expression, bigint=self.BIGINT_NUMBERS)()
 
     def _generate_op_func(self, operation: str) -> Callable:
         operation = re.sub(r"[\w$]{2}", "args", operation)
-        string = self._convert_to_js_operation(operation)
-        return lambda *args: eval(string)
+        return compile_expression(operation, bigint=self.BIGINT_NUMBERS)
 
     def _get_operations(self) -> dict[int, Callable]:
         functions = {}
 
-        compute_op_func = _re(Patterns.COMPUTE_OP_FUNC, self.script).group(1)
-        for num, operation in _re(Patterns.OPERATION, compute_op_func, all=True):
+        for num, operation in self.index.operations:
             functions[int(num)] = self._generate_op_func(operation.split("=")[1])
 
         return functions
@@ -531,6 +676,9 @@ class Megacloud:
         return array
 
     def _get_opcodes(self, ctx: str) -> list[int]:
+        if ctx in self.__opcodes:
+            return self.__opcodes[ctx]
+
         try:
             opcodes = _re(Patterns.SET_DEFAULT_OPCODE, ctx, all=True)
             opcodes = list(filter(lambda i: i <= 15, map(int, opcodes)))
@@ -538,6 +686,7 @@ class Megacloud:
         except ValueError:
             opcodes = [0]
 
+        self.__opcodes[ctx] = opcodes
         return opcodes
 
     def _apply_op(self, args: Iterable, *, ctx: str | None = None, opcode: int | None = None) -> int:
@@ -574,30 +723,34 @@ class Megacloud:
 
     def _var_to_num(self, var: str, ctx: str) -> str:
         if not var.isdigit():
-            var_name = var.replace("$", r"\$")
+            if (var, ctx) not in self.__numbers:
+                self.__numbers[var, ctx] = self._resolve_var(var, ctx)
+
+            return self.__numbers[var, ctx]
 
-            var_value = _re(Patterns.VAR.fmt(name=var_name), self.script)
-            var_value = var_value.group(1) or var_value.group(2)
-            var_value = re.sub(Patterns._FUNC, "", var_value)
+        return var
 
-            if 0 < len(var_value) < 4 and not var_value.isdigit():
-                return self._var_to_num(var_value, ctx)
+    def _resolve_var(self, var: str, ctx: str) -> str:
+        var_value = self.index.var(var)
+        var_value = var_value[0] or var_value[1]
+        var_value = Patterns._FUNC.compiled.sub("", var_value)
 
-            digits = re.findall(r"\d+", var_value)
-            assert len(digits) > 0
+        if 0 < len(var_value) < 4 and not var_value.isdigit():
+            return self._var_to_num(var_value, ctx)
 
-            if len(digits) == 1:
-                return str(digits[0])
+        digits = re.findall(r"\d+", var_value)
+        assert len(digits) > 0
 
-            result = self._apply_op(digits, ctx=ctx)
+        if len(digits) == 1:
+            return str(digits[0])
 
-            if not result:
-                var_value = " ".join(map(lambda t: m.group(1) if (m := re.search(r"(\d+)", t)) else t, var_value.split()))
-                result = eval(self._convert_to_js_operation(var_value))
+        result = self._apply_op(digits, ctx=ctx)
 
-            return str(result)
+        if not result:
+            var_value = " ".join(map(lambda t: m.group(1) if (m := re.search(r"(\d+)", t)) else t, var_value.split()))
+            result = self._evaluate(var_value)
 
-        return var
+        return str(result)
 
     def _get(self, values, ctx: str) -> str:
         values = list(filter(None, values))
@@ -608,7 +761,7 @@ class Megacloud:
 
         elif len(values) > 1:
             if not values[1].isdigit():
-                i = eval(self._convert_to_js_operation(" ".join(values)))
+                i = self._evaluate(" ".join(values))
 
             else:
                 i1 = int(self._var_to_num(values[0], ctx))
@@ -627,8 +780,7 @@ class Megacloud:
         raise ValueError(f"can't get {values}")
 
     def _resolve_secret_key(self) -> str:
-        ctx = _re(Patterns.GET_KEY_CTX, self.script).group(1)
-        get_key_body = _re(Patterns.GET_KEY_FUNC, ctx).group(2)
+        get_key_body = self.index.key_func
 
         functions: list[str] = []
 
@@ -691,6 +843,22 @@ class Megacloud:
 
         return "".join(shuffled_key)
 
+    def _decrypt_round(self, data: bytes, key: str) -> bytes:
+        # the shuffled key lookup doesn't depend on position, so it can run before the column shuffle
+        ascii_map = bytes.maketrans(self._shuffle_key(key).encode(), PRINTABLE)
+
+        offsets = lcg_offsets(hash(key), len(data), self.BIGINT_NUMBERS)
+        data = bytes(map(SUBSTITUTIONS.__getitem__, map(operator.add, offsets, data))).translate(ascii_map)
+
+        rows = len(data) // len(key)
+        order = sorted(range(len(key)), key=lambda i: key[i])
+        out = bytearray(rows * len(key))
+
+        for p, idx in enumerate(order):
+            out[idx::len(key)] = data[p * rows : (p + 1) * rows]
+
+        return bytes(out)
+
     def _process_sources(self, sources: list[str], key: str) -> list[str]:
         current_hash = hash(key)
         new_sources = []
@@ -712,9 +880,14 @@ class Megacloud:
         meta_parts = filter(None, _re(Patterns.CLIENT_KEY, resp).groups())
         return "".join(meta_parts)
 
-    async def _extract_secret_key(self) -> str:
+    async def _extract_script(self) -> str:
         script_url = f"{self.base_url}/js/player/a/v3/pro/embed-1.min.js"
-        self.script = await make_request(script_url, {}, {"v": int(time.time())}, lambda i: i.text())
+        return await make_request(script_url, {}, {"v": int(time.time())}, lambda i: i.text())
+
+    def _load_script(self, script: str) -> str:
+        """deobfuscate the player script and resolve the secret key from it"""
+        self.script = script
+        self.index = ScriptIndex(self.script)
 
         if _re(Patterns.BIGINT, self.script, default=None):
             self.BIGINT_NUMBERS = True
@@ -740,7 +913,17 @@ class Megacloud:
         assert key
         return key
 
-    def _decrypt_sources(self, secret_key: str, client_key: str, sources: str) -> dict:
+    def _decrypt(self, secret_key: str, client_key: str, sources: str) -> str:
+        data = base64.b64decode(sources)
+        if not data.isascii():
+            return self._decrypt_reference(secret_key, client_key, sources)
+
+        for _ in (key_transform := KeyTransform(secret_key, client_key, self.script)):
+            data = self._decrypt_round(data, key_transform.apply())
+
+        return data.decode()
+
+    def _decrypt_reference(self, secret_key: str, client_key: str, sources: str) -> str:
         sources_list = list(base64.b64decode(sources).decode())
         key_transform = KeyTransform(secret_key, client_key, self.script)
 
@@ -753,7 +936,10 @@ class Megacloud:
             key_to_ascii_map = {char: chr(i + 32) for i, char in enumerate(shuffled_key)}
             sources_list = list(map(lambda char: key_to_ascii_map[char], sources_list))
 
-        sources = "".join(sources_list)
+        return "".join(sources_list)
+
+    def _decrypt_sources(self, secret_key: str, client_key: str, sources: str) -> dict:
+        sources = self._decrypt(secret_key, client_key, sources)
         sources = _re(Patterns.SOURCES, sources).group(1)
 
         return json.loads(sources)
@@ -766,10 +952,8 @@ class Megacloud:
         resp = await make_request(get_src_url, self.headers, {"id": id, "_k": client_key}, lambda i: i.json())
 
         if resp["encrypted"]:
-            secret_key = await self._extract_secret_key()
-            sources = self._decrypt_sources(secret_key, client_key, resp["sources"])
-
-            resp["sources"] = sources
+            script = await self._extract_script()
+            resp["sources"] = await executor.run(decrypt_sources, script, client_key, resp["sources"])
 
         intro = resp["intro"]["start"], resp["intro"]["end"]
         outro = resp["outro"]["start"], resp["outro"]["end"]
@@ -782,6 +966,14 @@ class Megacloud:
         )
 
 
+def decrypt_sources(script: str, client_key: str, sources: str) -> dict:
+    """key resolution and decryption in one go, at module level so it can run in a worker process"""
+    m = Megacloud("")
+    secret_key = m._load_script(script)
+
+    return m._decrypt_sources(secret_key, client_key, sources)
+
+
 async def main():
     m = Megacloud("https://megacloud.blog/embed-2/v3/e-1/pkpZzfTrd8m8?k=1&autoPlay=1&oa=0&asi=1")
     print(await m.extract())
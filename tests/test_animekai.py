@@ -0,0 +1,23 @@
+import random
+
+import pytest
+
+from anipy.providers.animekai.extractor import IFRAME_ROUNDS, PARAMS_ROUNDS, SOURCES_ROUNDS, apply_rounds
+
+ROUNDS = {"params": PARAMS_ROUNDS, "iframe": IFRAME_ROUNDS, "sources": SOURCES_ROUNDS}
+KEY_TRANSFORMS = {
+    "identity": None,
+    "reversed": lambda k: bytes(reversed(k)),
+    "xor": lambda k: bytes(b ^ ord("k") for b in k),
+}
+
+
+@pytest.mark.parametrize("transform", KEY_TRANSFORMS)
+@pytest.mark.parametrize("rounds", ROUNDS)
+@pytest.mark.parametrize("n", [0, 1, 7, 15, 33, 161, 4097])
+def test_apply_rounds_matches_reference(n: int, rounds: str, transform: str):
+    data = random.Random(n).randbytes(n)
+    key_transform = KEY_TRANSFORMS[transform]
+
+    fast = apply_rounds(data, ROUNDS[rounds], key_transform)
+    assert fast == apply_rounds(data, ROUNDS[rounds], key_transform, reference=True)
@@ -0,0 +1,142 @@
+import base64
+import itertools
+import random
+import re
+
+import pytest
+
+from anipy.providers.hianime.extractor import HEXDIGITS, PRINTABLE, Megacloud, Patterns, ScriptIndex, _re, compile_expression
+
+
+def convert_to_js_operation(operation: str, bigint: bool) -> str:
+    """the regex rewrite compile_expression replaced, kept as the reference"""
+    operand = r"\([\w$ *>^+&\[\]]+\)|[\w$]+\[\d\]|int\(.+?\)"
+    multi = rf"({operand}) (\*|\/|\+|-) ({operand})"
+    shift = rf"({operand}) (>>|<<) ({operand})"
+
+    if not bigint:
+        while re.search(multi, operation):
+            operation = re.sub(multi, r"int(float(\1) \2 float(\3))", operation)
+
+    while re.search(shift, operation):
+        operation = re.sub(shift, r"\1 \2 (\3 & 31)", operation)
+
+    return operation
+
+
+# switch cases of the compute op function, after _generate_op_func renamed the variable to args
+OP_SHAPES = [
+    "args[0] + args[1]",
+    "args[0] - args[1]",
+    "args[0] * args[1]",
+    "args[0] / args[1]",
+    "args[0] % args[1]",
+    "args[0] ^ args[1]",
+    "args[0] | args[1]",
+    "args[0] & args[1]",
+    "args[0] >> args[1]",
+    "args[0] << args[1]",
+    "(args[0] ^ args[1]) + args[0]",
+    "(args[0] + args[1]) * args[1]",
+    "args[0] << (args[1] & args[0])",
+]
+ARGS = [(7, 3), (255, 31), (1, 40), (123456789, 17), (-9, 4), (2**31 - 1, 33)]
+
+
+@pytest.mark.parametrize("bigint", [False, True])
+@pytest.mark.parametrize("shape", OP_SHAPES)
+def test_compile_expression_matches_regex_rewrite(shape: str, bigint: bool):
+    func = compile_expression(shape, bigint=bigint)
+    reference = convert_to_js_operation(shape, bigint)
+
+    for args in ARGS:
+        assert func(*args) == eval(reference, {"args": args}), (shape, args)
+
+
+@pytest.mark.parametrize("source", ["9 ** 9 ** 9", "1 << 10 ** 9", "args[0] @ args[1]", "__import__('os')", "args.__class__"])
+def test_compile_expression_rejects(source: str):
+    for numeric, bigint in itertools.product((True, False), repeat=2):
+        with pytest.raises(ValueError):
+            compile_expression(source, numeric=numeric, bigint=bigint)
+
+
+def test_compile_expression_masks_shifts():
+    for numeric, bigint in itertools.product((True, False), repeat=2):
+        assert compile_expression("1 << 100", numeric=numeric, bigint=bigint)() == 1 << 4
+
+
+@pytest.mark.parametrize("bigint", [False, True])
+@pytest.mark.parametrize("n", [0, 1, 7, 95, 4097])
+def test_decrypt_matches_reference(n: int, bigint: bool):
+    rng = random.Random(n)
+
+    m = Megacloud("https://megacloud.blog/embed-2/v3/e-1/x?k=1")
+    # enough of a script for the key transforms to pick their rounds from
+    m.script = 'ab % cd[+"7"'
+    m.BIGINT_NUMBERS = bigint
+
+    secret_key = "".join(rng.choices(HEXDIGITS, k=64))
+    client_key = "".join(rng.choices(HEXDIGITS, k=48))
+    sources = base64.b64encode(bytes(rng.choices(PRINTABLE, k=n))).decode()
+
+    assert m._decrypt(secret_key, client_key, sources) == m._decrypt_reference(secret_key, client_key, sources)
+
+
+def scan_var(name: str, script: str) -> tuple[str | None, str | None] | None:
+    """the per lookup Patterns.VAR search ScriptIndex.var replaced, kept as the reference"""
+    m = _re(Patterns.VAR.fmt(name=name), script, default=None)
+    return m.groups() if m else None
+
+
+def index_var(index: ScriptIndex, name: str, within: tuple[int, int] | None = None) -> tuple[str | None, str | None] | None:
+    try:
+        return index.var(name, within)
+
+    except ValueError:
+        return None
+
+
+# script fragments around the two assignment forms, nested in each other and in calls
+VAR_TOKENS = [
+    "a", "b", "$c", "ab", "a$", "=", " = ", ";", "(", ")", ",", "{", "}", " ", "1", "xy.zw(3)", "var ", "=>",
+    ";a=", " b=", "{$c=", "(ab = ", ",a$ = ", ",b = ",
+]
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_script_index_var_matches_scan(seed: int):
+    rng = random.Random(seed)
+    script = "".join(rng.choices(VAR_TOKENS, k=rng.randint(5, 60)))
+    index = ScriptIndex(script)
+
+    for name in ["a", "b", "$c", "ab", "a$", "zz"]:
+        assert index_var(index, name) == scan_var(name, script), (script, name)
+
+
+KEY_CTX_SCRIPT = (
+    'function Ub(){return "x";}var Qm=1;H[71]=(function(Tq){var Zp=Tq;switch(Zp){'
+    "case 0:Rt=Wq[0]-Wq[1];break;case 1:Rt=Wq[0]+Wq[1];break;case 4:Rt=Wq[0]^Wq[1];break;}return Rt});"
+    ";f=[12,Abc.cd(40),Abc.cd(Abc.cd(99,59))];x=Abc.cd(7);u=Abc.cd(19);"
+    "var " + ",".join("abcdefghijklmnopqrstuvwxyzABCDE") + ";c=Abc.cd(Abc.cd(131,90,Abc.cd(0)));"
+    "Abc.cd(3);k=()=>{Abc.cd(4);var x=Abc.cd(22),u=Abc.cd(23);return Xy.zw(x,u)};"
+    "j=()=>{return Abc.cd(24)};h=(w = 5);g=()=>{return Abc.cd(25)};"
+    ";q=[Abc.cd(1),Abc.cd(2)];try{k()}catch(e){}x=Abc.cd(8);"
+)
+
+
+def test_script_index_matches_scans():
+    index = ScriptIndex(KEY_CTX_SCRIPT)
+    ctx = _re(Patterns.GET_KEY_CTX, KEY_CTX_SCRIPT).group(1)
+
+    assert index.key_ctx == ctx
+    assert KEY_CTX_SCRIPT[slice(*index.key_ctx_span)] == ctx
+    assert index.key_funcs == _re(Patterns.GET_KEY_FUNC, ctx, all=True)
+    assert index.key_func == _re(Patterns.GET_KEY_FUNC, ctx).group(2)
+    assert index.arrays == _re(Patterns.ARRAY_CONTENT, KEY_CTX_SCRIPT, all=True)
+    assert index.operations == _re(Patterns.OPERATION, _re(Patterns.COMPUTE_OP_FUNC, KEY_CTX_SCRIPT).group(1), all=True)
+    assert len(index.key_funcs) == 3 and len(index.arrays) == 2 and len(index.operations) == 3
+
+    # compute_strings looks its operands up inside the key context, the rest in the whole script
+    for name in ["x", "u", "w", "c", "k", "q", "zz"]:
+        assert index_var(index, name, index.key_ctx_span) == scan_var(name, ctx), name
+        assert index_var(index, name) == scan_var(name, KEY_CTX_SCRIPT), name